@@ -0,0 +1,183 @@
+"""
+Per-user expense analytics over NumPy arrays.
+A user's expenses are loaded once into compact columns (day numbers, amounts,
+category codes) and every summary is a bincount/cumsum over them, so a
+statistic over years of history costs a few passes in C, not a Python loop
+per row.
+"""
+import numpy as np
+from reports import FIXED_CATEGORIES, NON_SPENDING_CATEGORIES
+
+# Layout of the rows ExpenseArrays.from_rows() takes
+ROW_DTYPE = np.dtype([('day', np.int32), ('category', object), ('subcategory', object),
+                      ('amount', np.float64), ('is_bill', bool)])
+
+
+def month_index(year, month):
+    """Months since 1970-01, the unit of ExpenseArrays.month"""
+    return (int(year) - 1970) * 12 + int(month) - 1
+
+
+def month_label(index):
+    """Inverse of month_index as 'YYYY-MM'"""
+    year, month = divmod(int(index), 12)
+    return f'{year + 1970}-{month + 1:02d}'
+
+
+class ExpenseArrays:
+    """One user's expenses as parallel NumPy columns"""
+
+    def __init__(self, day, amount, category, subcategory, is_bill, categories, subcategories):
+        self.day = day                  # int32 days since 1970-01-01
+        self.amount = amount            # float64
+        self.category = category        # int16 index into categories
+        self.subcategory = subcategory  # int32 index into subcategories, -1 for none
+        self.is_bill = is_bill          # bool
+        self.categories = categories
+        self.subcategories = subcategories
+        self.month = day.astype('datetime64[D]').astype('datetime64[M]').astype(np.int32)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build the arrays from (day, category, subcategory, amount, is_bill) rows.
+
+        Args:
+            rows: List of plain tuples (e.g. straight from a DBAPI cursor), day
+                as an integer count of days since 1970-01-01
+        """
+        # One C-level conversion into a structured array, instead of
+        # transposing the rows in Python
+        table = np.array(rows, dtype=ROW_DTYPE)
+        category_codes = {}
+        subcategory_codes = {None: -1}
+        # Columns are copied out rather than kept as views: a view would keep
+        # the whole table alive, with a Python string per row in its object
+        # columns, for as long as the arrays stay cached
+        return cls(
+            table['day'].copy(),
+            table['amount'].copy(),
+            np.fromiter((category_codes.setdefault(value, len(category_codes)) for value in table['category']),
+                        dtype=np.int16, count=len(table)),
+            np.fromiter((subcategory_codes.setdefault(value, len(subcategory_codes) - 1)
+                         for value in table['subcategory']), dtype=np.int32, count=len(table)),
+            table['is_bill'].copy(),
+            list(category_codes),
+            list(subcategory_codes)[1:]
+        )
+
+    def __len__(self):
+        return len(self.day)
+
+    def codes_of(self, names):
+        """Category codes for the given names that occur in these expenses"""
+        return [code for code, name in enumerate(self.categories) if name in names]
+
+    def spending_mask(self):
+        """Rows that count as spending (everything but Income/Investment/Payment)"""
+        return ~np.isin(self.category, self.codes_of(NON_SPENDING_CATEGORIES))
+
+    def fixed_mask(self):
+        """Rows that count against the fixed budget, per reports.is_fixed"""
+        fixed = np.isin(self.category, self.codes_of(FIXED_CATEGORIES))
+        subscription = self.codes_of(('Subscription',))
+        if subscription:
+            fixed |= (self.category == subscription[0]) & self.is_bill
+        return fixed
+
+    def day_mask(self, start_day=None, end_day=None):
+        """Rows dated in [start_day, end_day), either bound optional"""
+        mask = np.ones(len(self), dtype=bool)
+        if start_day is not None:
+            mask &= self.day >= start_day
+        if end_day is not None:
+            mask &= self.day < end_day
+        return mask
+
+
+def category_totals(arrays, mask=None):
+    """
+    Total and count per category.
+
+    Args:
+        arrays: ExpenseArrays
+        mask: Optional boolean row filter
+
+    Returns:
+        List of (category, total, count), largest total first
+    """
+    category, amount = arrays.category, arrays.amount
+    if mask is not None:
+        category, amount = category[mask], amount[mask]
+    size = len(arrays.categories)
+    totals = np.bincount(category, weights=amount, minlength=size)
+    counts = np.bincount(category, minlength=size)
+    order = np.argsort(-totals, kind='stable')
+    return [(arrays.categories[code], float(totals[code]), int(counts[code])) for code in order if counts[code]]
+
+
+def subcategory_totals(arrays, mask=None):
+    """
+    Total per (category, subcategory) pair; expenses without one fall under None.
+
+    Returns:
+        Dict of category -> list of (subcategory, total), largest first
+    """
+    category, subcategory, amount = arrays.category, arrays.subcategory, arrays.amount
+    if mask is not None:
+        category, subcategory, amount = category[mask], subcategory[mask], amount[mask]
+    width = len(arrays.subcategories) + 1  # +1 for "no subcategory", stored as -1
+    pairs = category.astype(np.int64) * width + (subcategory + 1)
+    totals = np.bincount(pairs, weights=amount, minlength=len(arrays.categories) * width)
+    counts = np.bincount(pairs, minlength=len(arrays.categories) * width)
+    names = [None] + arrays.subcategories
+    breakdown = {}
+    for pair in np.flatnonzero(counts):
+        code, sub = divmod(int(pair), width)
+        breakdown.setdefault(arrays.categories[code], []).append((names[sub], float(totals[pair])))
+    for entries in breakdown.values():
+        entries.sort(key=lambda entry: -entry[1])
+    return breakdown
+
+
+def monthly_series(arrays, first_month, last_month, mask=None):
+    """
+    Monthly totals over an inclusive range of month indexes, zero for empty months.
+
+    Returns:
+        (totals, per_category): float arrays of shape (months,) and (months, len(categories))
+    """
+    months = last_month - first_month + 1
+    size = len(arrays.categories)
+    in_range = (arrays.month >= first_month) & (arrays.month <= last_month)
+    if mask is not None:
+        in_range &= mask
+    month = arrays.month[in_range] - first_month
+    cells = month.astype(np.int64) * size + arrays.category[in_range]
+    per_category = np.bincount(cells, weights=arrays.amount[in_range], minlength=months * size).reshape(months, size)
+    return per_category.sum(axis=1), per_category
+
+
+def rolling_mean(values, window):
+    """Trailing mean over window entries; the first entries average what is available"""
+    sums = np.cumsum(np.concatenate(([0.0], values)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+def month_over_month(values):
+    """
+    Change from each month to the next.
+
+    Returns:
+        (delta, percent): delta[0] is 0; percent is NaN where the previous month was 0
+    """
+    values = np.asarray(values, dtype=np.float64)
+    delta = np.diff(values, prepend=values[:1])
+    previous = np.concatenate((values[:1], values[:-1]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent = np.where(previous != 0, delta / previous * 100, np.nan)
+    if len(percent):
+        percent[0] = np.nan
+    return delta, percent
@@ -1,14 +1,26 @@
-from flask import Flask, render_template, request, jsonify, send_file, session, redirect, url_for
+from flask import Flask, Response, make_response, render_template, request, jsonify, send_file, session, redirect, url_for, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+import base64
 import csv
 import io
+import json
 import os
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
+import re
+import threading
+import zlib
 from functools import wraps
 from werkzeug.security import check_password_hash, generate_password_hash
-from email_service import send_budget_email, send_test_email
+from analytics import (
+    ExpenseArrays, category_totals, month_index, month_label, month_over_month, monthly_series, rolling_mean,
+    subcategory_totals,
+)
+from excel_export import write_expense_workbook
+from expense_import import ImportFormatError, iter_csv_rows, iter_xlsx_rows, parse_row
+from reports import build_budget_data, category_totals_statement
 
 # Load environment variables from .env file if it exists
 try:
@@ -17,6 +29,18 @@ try:
 except ImportError:
     pass  # python-dotenv not installed, that's okay
 
+# orjson serializes several times faster than the json module; optional
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Brotli compresses JSON a little smaller than gzip; optional, gzip is the fallback
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 app = Flask(__name__)
 # Use environment variable for secret key, or generate one
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', os.urandom(24).hex())
@@ -48,6 +72,105 @@ def get_current_user_id():
     return session.get('user_id')
 
 
+# Categories that are money movements rather than spending
+EXCLUDED_SPENDING_CATEGORIES = ['Income', 'Investment', 'Payment']
+
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD string (extra time suffixes are ignored) into a date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value[:10], '%Y-%m-%d').date()
+
+
+def month_bounds(year, month):
+    """Return the half-open [first, next_first) date range covering a month; raises ValueError for invalid months"""
+    year, month = int(year), int(month)
+    first = date(year, month, 1)
+    if month == 12:
+        if year == date.max.year:
+            raise ValueError(f'year must be at most {date.max.year - 1} when month is 12')
+        next_first = date(year + 1, 1, 1)
+    else:
+        next_first = date(year, month + 1, 1)
+    return first, next_first
+
+
+def encode_expense_cursor(expense):
+    """Opaque keyset cursor pointing just past an expense in (date, created_at, id) order"""
+    key = [expense.date.isoformat(), expense.created_at.isoformat(), expense.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+
+def decode_expense_cursor(cursor):
+    """Inverse of encode_expense_cursor; raises ValueError for malformed cursors"""
+    try:
+        expense_date, created_at, expense_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return date.fromisoformat(expense_date), datetime.fromisoformat(created_at), int(expense_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor: {e}') from e
+
+
+def encode_search_cursor(rank, expense_id):
+    """Opaque keyset cursor pointing just past a search result in (rank, id) order"""
+    return base64.urlsafe_b64encode(json.dumps([rank, expense_id]).encode('utf-8')).decode('ascii')
+
+
+def decode_search_cursor(cursor):
+    """Inverse of encode_search_cursor; raises ValueError for malformed cursors"""
+    try:
+        rank, expense_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(rank), int(expense_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor: {e}') from e
+
+
+# Sort keys for /api/expenses/query, each the column order of the index that serves it
+EXPENSE_QUERY_SORTS = {
+    'date': ('date', 'created_at', 'id'),
+    'amount': ('amount', 'id'),
+    'category': ('category', 'date', 'created_at', 'id'),
+}
+
+
+def encode_query_cursor(sort, expense):
+    """Opaque keyset cursor pointing just past an expense in its sort key order"""
+    values = [getattr(expense, name) for name in EXPENSE_QUERY_SORTS[sort]]
+    values = [value.isoformat() if isinstance(value, date) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps([sort, *values]).encode('utf-8')).decode('ascii')
+
+
+def decode_query_cursor(cursor, sort):
+    """Inverse of encode_query_cursor; raises ValueError for malformed cursors or a different sort"""
+    parsers = {'date': date.fromisoformat, 'created_at': datetime.fromisoformat, 'amount': float, 'id': int}
+    try:
+        cursor_sort, *values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if cursor_sort != sort:
+            raise ValueError(f'cursor is for sort={cursor_sort}')
+        names = EXPENSE_QUERY_SORTS[sort]
+        if len(values) != len(names):
+            raise ValueError(f'expected {len(names)} key values')
+        key = []
+        for name, value in zip(names, values):
+            if name in parsers:
+                key.append(parsers[name](value))
+            elif isinstance(value, str):
+                key.append(value)
+            else:
+                raise ValueError(f'bad {name} value')
+        return tuple(key)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor: {e}') from e
+
+
+def filter_by_month(query, year, month):
+    """Restrict an Expense query to one month with an index-friendly range predicate"""
+    first, next_first = month_bounds(year, month)
+    return query.filter(Expense.date >= first, Expense.date < next_first)
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -55,6 +178,8 @@ class User(db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     email_notifications_enabled = db.Column(db.Boolean, default=False, nullable=False)
     notification_email = db.Column(db.String(120), nullable=True)  # Custom email for notifications (defaults to registered email)
+    data_version = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # Bumped on every write to the user's data
+    tombstone_floor = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # Newest version whose tombstones were pruned
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def check_password(self, password):
@@ -78,7 +203,7 @@ class User(db.Model):
 class Expense(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    date = db.Column(db.String(20), nullable=False)
+    date = db.Column(db.Date, nullable=False)
     category = db.Column(db.String(100), nullable=False)
     subcategory = db.Column(db.String(100), nullable=True)  # Optional subcategory for detailed tracking
     description = db.Column(db.String(500), nullable=False)
@@ -87,13 +212,36 @@ class Expense(db.Model):
     is_active = db.Column(db.Boolean, default=True, nullable=False)  # For tracking active/cancelled subscriptions
     is_bill = db.Column(db.Boolean, default=False, nullable=False)  # For subscriptions that are bills (chequing)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    version = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # User's data_version when this row last changed
     
     user = db.relationship('User', backref=db.backref('expenses', lazy=True))
 
+    __table_args__ = (
+        # Month filters are range scans over a single user's history, and the
+        # trailing (created_at, id) columns match the list order for keyset paging
+        db.Index('ix_expense_user_date_created', 'user_id', 'date', 'created_at', 'id'),
+        # Delta sync reads a user's rows changed after a version
+        db.Index('ix_expense_user_version', 'user_id', 'version'),
+        # Category sets in /api/expenses/query, each read in the list's date order
+        db.Index('ix_expense_user_category_date', 'user_id', 'category', 'date', 'created_at', 'id'),
+        # Amount ranges and amount-ordered pages
+        db.Index('ix_expense_user_amount', 'user_id', 'amount', 'id'),
+        # Most expenses have no subcategory, so only index the ones that do
+        db.Index('ix_expense_user_subcategory', 'user_id', 'subcategory', 'date', 'created_at', 'id',
+                 sqlite_where=subcategory.isnot(None), postgresql_where=subcategory.isnot(None)),
+        # Active recurring expenses (subscriptions), read on every dashboard load
+        # by generate_recurring_for_month, which groups them in this column order.
+        # Queries must spell the predicate the same way (.is_(True)) to use it
+        db.Index('ix_expense_active_recurring', 'user_id', 'description', 'category', 'amount',
+                 sqlite_where=db.and_(is_recurring.is_(True), is_active.is_(True)),
+                 postgresql_where=db.and_(is_recurring.is_(True), is_active.is_(True))),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
-            'date': self.date,
+            'date': self.date.strftime('%Y-%m-%d'),
             'category': self.category,
             'subcategory': self.subcategory,
             'description': self.description,
@@ -105,6 +253,185 @@ class Expense(db.Model):
         }
 
 
+# Columns behind Expense.to_dict(), for read paths that skip the ORM
+EXPENSE_READ_COLUMNS = (
+    Expense.id, Expense.date, Expense.category, Expense.subcategory, Expense.description, Expense.amount,
+    Expense.is_recurring, Expense.is_active, Expense.is_bill, Expense.created_at,
+)
+EXPENSE_COLUMN_NAMES = tuple(column.key for column in EXPENSE_READ_COLUMNS)
+# Rows fetched and serialized per chunk of a streamed JSON array
+JSON_STREAM_BATCH_SIZE = 2000
+
+
+def expense_row_dicts(rows):
+    """Expense.to_dict() for rows of EXPENSE_READ_COLUMNS"""
+    # Unpacking the row tuples is several times faster than named attribute access
+    return [{
+        'id': expense_id,
+        'date': expense_date.isoformat(),
+        'category': category,
+        'subcategory': subcategory,
+        'description': description,
+        'amount': amount,
+        'is_recurring': is_recurring,
+        'is_active': is_active,
+        'is_bill': is_bill,
+        'created_at': created_at.isoformat(' ', 'seconds') if created_at else None
+    } for (expense_id, expense_date, category, subcategory, description, amount,
+           is_recurring, is_active, is_bill, created_at) in rows]
+
+
+def expense_columns(rows):
+    """
+    Rows of EXPENSE_READ_COLUMNS as parallel arrays, for ?format=columnar.
+
+    Returns {"format": "columnar", "count": n, "categories": [...], "columns":
+    {field: [...]}} with the same fields as Expense.to_dict(). Categories are
+    dictionary-encoded: columns.category holds indexes into categories. The
+    flags are 0/1.
+    """
+    if not rows:
+        columns = {name: [] for name in EXPENSE_COLUMN_NAMES}
+        return {'format': 'columnar', 'count': 0, 'categories': [], 'columns': columns}
+    (expense_ids, dates, categories, subcategories, descriptions, amounts,
+     recurring, active, bills, created) = zip(*rows)
+    codes = {}
+    category_codes = [codes.setdefault(value, len(codes)) for value in categories]
+    return {
+        'format': 'columnar',
+        'count': len(rows),
+        'categories': list(codes),
+        'columns': {
+            'id': expense_ids,
+            'date': [value.isoformat() for value in dates],
+            'category': category_codes,
+            'subcategory': subcategories,
+            'description': descriptions,
+            'amount': amounts,
+            'is_recurring': [int(value) for value in recurring],
+            'is_active': [int(value) for value in active],
+            'is_bill': [int(value) for value in bills],
+            'created_at': [value.isoformat(' ', 'seconds') if value else None for value in created]
+        }
+    }
+
+
+def wants_columnar():
+    """Whether the request asked for ?format=columnar; raises ValueError for unknown formats"""
+    response_format = request.args.get('format', 'rows')
+    if response_format not in ('rows', 'columnar'):
+        raise ValueError('format must be rows or columnar')
+    return response_format == 'columnar'
+
+
+def dump_json(value):
+    """Compact JSON bytes, through orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def stream_expense_rows(statement):
+    """
+    Stream a SELECT of EXPENSE_READ_COLUMNS as a JSON array response.
+
+    Rows are fetched JSON_STREAM_BATCH_SIZE at a time (a server-side cursor on
+    PostgreSQL) and each batch is serialized in one call, so memory holds one
+    batch however many rows the user has.
+    """
+    def generate():
+        yield b'['
+        separator = b''
+        result = db.session.execute(statement.execution_options(yield_per=JSON_STREAM_BATCH_SIZE))
+        for rows in result.partitions():
+            # Strip the batch's own brackets and splice it into the outer array
+            yield separator + dump_json(expense_row_dicts(rows))[1:-1]
+            separator = b','
+        yield b']'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def expense_columns_response(statement):
+    """A SELECT of EXPENSE_READ_COLUMNS as a columnar JSON response"""
+    return Response(dump_json(expense_columns(db.session.execute(statement).all())), mimetype='application/json')
+
+
+# Full-text search over expense descriptions and subcategories. SQLite keeps an
+# FTS5 index (external content, so the text isn't stored twice) in step with
+# the expense table through triggers; user_id is indexed too so a search only
+# walks the posting lists of one user's rows. PostgreSQL indexes the tsvector
+# expression itself, which it maintains on every write.
+EXPENSE_SEARCH_VECTOR = "to_tsvector('simple', coalesce(description, '') || ' ' || coalesce(subcategory, ''))"
+EXPENSE_SEARCH_DDL = {
+    'sqlite': [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS expense_fts USING fts5(
+            description, subcategory, user_id,
+            content='expense', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )""",
+        # (user_id, version) pairs whose inserted rows an import indexes itself
+        """CREATE TABLE IF NOT EXISTS expense_fts_deferred (
+            user_id INTEGER NOT NULL, version INTEGER NOT NULL, PRIMARY KEY (user_id, version)
+        )""",
+        """CREATE TRIGGER IF NOT EXISTS expense_fts_insert AFTER INSERT ON expense
+        WHEN NOT EXISTS (SELECT 1 FROM expense_fts_deferred WHERE user_id = new.user_id AND version = new.version)
+        BEGIN
+            INSERT INTO expense_fts (rowid, description, subcategory, user_id)
+            VALUES (new.id, new.description, new.subcategory, new.user_id);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS expense_fts_delete AFTER DELETE ON expense BEGIN
+            INSERT INTO expense_fts (expense_fts, rowid, description, subcategory, user_id)
+            VALUES ('delete', old.id, old.description, old.subcategory, old.user_id);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS expense_fts_update AFTER UPDATE OF description, subcategory, user_id ON expense BEGIN
+            INSERT INTO expense_fts (expense_fts, rowid, description, subcategory, user_id)
+            VALUES ('delete', old.id, old.description, old.subcategory, old.user_id);
+            INSERT INTO expense_fts (rowid, description, subcategory, user_id)
+            VALUES (new.id, new.description, new.subcategory, new.user_id);
+        END""",
+    ],
+    'postgresql': [
+        f"CREATE INDEX IF NOT EXISTS ix_expense_search ON expense USING GIN ({EXPENSE_SEARCH_VECTOR})",
+    ],
+}
+
+
+@db.event.listens_for(Expense.__table__, 'after_create')
+def create_expense_search_index(target, connection, **kw):
+    """Build the search index alongside a newly created expense table"""
+    for statement in EXPENSE_SEARCH_DDL.get(connection.dialect.name, []):
+        connection.execute(db.text(statement))
+
+
+def defer_search_indexing(user_id, version):
+    """
+    Leave the expenses a user inserts at a version out of the search index
+    until index_deferred_expenses().
+
+    FTS5 flushes its pending terms at the end of every statement, and a
+    trigger runs one statement per row, so indexing a bulk insert row by row
+    costs about five times as much as one INSERT ... SELECT afterwards. The
+    marker row lives in the caller's transaction, so a rollback discards it
+    along with the rows. No-op on PostgreSQL.
+    """
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(db.text('INSERT INTO expense_fts_deferred (user_id, version) VALUES (:user_id, :version)'),
+                           {'user_id': user_id, 'version': version})
+
+
+def index_deferred_expenses(user_id, version):
+    """Index the expenses inserted at a version since defer_search_indexing() in one statement"""
+    if db.engine.dialect.name != 'sqlite':
+        return
+    params = {'user_id': user_id, 'version': version}
+    db.session.execute(db.text(
+        'INSERT INTO expense_fts (rowid, description, subcategory, user_id) '
+        'SELECT id, description, subcategory, user_id FROM expense WHERE user_id = :user_id AND version = :version'
+    ), params)
+    db.session.execute(db.text('DELETE FROM expense_fts_deferred WHERE user_id = :user_id AND version = :version'),
+                       params)
+
+
 class BudgetLimit(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -129,6 +456,460 @@ class BudgetLimit(db.Model):
         }
 
 
+class ExpenseTombstone(db.Model):
+    """Marks a deleted expense so delta sync can tell clients to drop it"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    expense_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False)  # User's data_version when the expense was deleted
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_expense_tombstone_user_version', 'user_id', 'version'),
+    )
+
+
+class MonthlyRollup(db.Model):
+    """Per-user monthly totals by category, kept in step with every Expense write"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    month = db.Column(db.String(7), nullable=False)  # Format: YYYY-MM
+    category = db.Column(db.String(100), nullable=False)
+    is_bill = db.Column(db.Boolean, default=False, nullable=False)
+    total = db.Column(db.Float, default=0, nullable=False)
+    expense_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'month', 'category', 'is_bill', name='uq_monthly_rollup_key'),
+    )
+    
+    def to_dict(self):
+        return {
+            'month': self.month,
+            'category': self.category,
+            'is_bill': self.is_bill,
+            'total': self.total,
+            'expense_count': self.expense_count
+        }
+
+
+class RecurringGeneration(db.Model):
+    """Ledger of recurring instances generated per month; its unique key makes generation idempotent"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    month = db.Column(db.String(7), nullable=False)  # Format: YYYY-MM
+    description = db.Column(db.String(500), nullable=False)
+    category = db.Column(db.String(100), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'month', 'description', 'category', 'amount',
+                            name='uq_recurring_generation_key'),
+    )
+
+
+class EmailOutbox(db.Model):
+    """An email waiting for (or done with) delivery by email_worker.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'budget_report' or 'test'
+    recipient = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.Text, nullable=True)  # JSON, e.g. the report's budget_data
+    status = db.Column(db.String(10), default='pending', nullable=False)  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime, nullable=True)  # When a worker claimed it
+    last_error = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # Workers poll for due jobs in this order
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+
+def enqueue_email(kind, recipient, payload=None, user_id=None):
+    """Add an email to the outbox; it is sent once the caller commits"""
+    job = EmailOutbox(
+        user_id=user_id,
+        kind=kind,
+        recipient=recipient,
+        payload=json.dumps(payload) if payload is not None else None
+    )
+    db.session.add(job)
+    return job
+
+
+def bump_data_version(user_id):
+    """
+    Advance a user's data version in the current transaction so cached reads revalidate.
+
+    Returns the new version; expenses written in the same transaction are stamped
+    with it so GET /api/expenses/changes can find them. Call it before those
+    writes: the row lock it takes on the user serialises concurrent writers, so
+    versions commit in order.
+    """
+    return db.session.execute(
+        db.update(User).where(User.id == user_id)
+        .values(data_version=User.data_version + 1)
+        .returning(User.data_version)
+    ).scalar_one()
+
+
+# Days a deleted expense's tombstone is kept for delta sync; a client that
+# hasn't synced for longer has to download everything again
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get('TOMBSTONE_RETENTION_DAYS', '90'))
+
+
+def record_tombstones(user_id, expense_ids, version):
+    """Record deleted expense ids for delta sync"""
+    if expense_ids:
+        deleted_at = datetime.utcnow()
+        db.session.execute(db.insert(ExpenseTombstone), [
+            {'user_id': user_id, 'expense_id': expense_id, 'version': version, 'deleted_at': deleted_at}
+            for expense_id in expense_ids
+        ])
+
+
+def prune_expense_tombstones(retention_days=TOMBSTONE_RETENTION_DAYS):
+    """
+    Delete tombstones older than retention_days and return how many went.
+    
+    Each affected user's tombstone_floor is raised to the newest version
+    pruned, in the same transaction, so /api/expenses/changes can tell a sync
+    token that may have missed a deletion from one that can't.
+    """
+    expired = ExpenseTombstone.deleted_at < datetime.utcnow() - timedelta(days=retention_days)
+    floors = db.session.query(ExpenseTombstone.user_id, db.func.max(ExpenseTombstone.version)) \
+        .filter(expired).group_by(ExpenseTombstone.user_id).all()
+    if not floors:
+        db.session.rollback()
+        return 0
+    db.session.execute(db.update(User), [
+        {'id': user_id, 'tombstone_floor': floor} for user_id, floor in floors
+    ])
+    pruned = db.session.execute(
+        db.delete(ExpenseTombstone).where(expired).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return pruned
+
+
+def etag_by_data_version(f):
+    """
+    Tag GET responses with the user's data version and answer If-None-Match with 304.
+    
+    Views that fall back to the current month or year (trend and monthly
+    analytics without `end`, expenses with a month but no year) answer the
+    same URL differently once the month turns, so the current month is part
+    of every tag; it costs each client one full response per month.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        user_id = get_current_user_id()
+        version = db.session.query(User.data_version).filter(User.id == user_id).scalar()
+        current_month = datetime.now().strftime('%Y%m')
+        etag = f'{user_id}-{version}-{current_month}-{zlib.crc32(request.full_path.encode("utf-8")):08x}'
+        
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return decorated_function
+
+
+# Responses smaller than this go out uncompressed
+COMPRESS_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+# Brotli's default quality (11) is far too slow to run per request
+BROTLI_QUALITY = 5
+
+
+def response_compressor():
+    """
+    Pick a Content-Encoding the client accepts: br (when brotli is installed),
+    then gzip.
+
+    Returns:
+        (encoding, compress(bytes) -> bytes, finish() -> bytes), or None to send identity
+    """
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return 'br', compressor.process, compressor.finish
+    if accepted['gzip']:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31 writes a gzip header
+        return 'gzip', compressor.compress, compressor.flush
+    return None
+
+
+def compress_response(f):
+    """Compress successful responses per Accept-Encoding; streamed bodies are compressed as they stream"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        response = make_response(f(*args, **kwargs))
+        response.vary.add('Accept-Encoding')
+        if response.status_code != 200 or 'Content-Encoding' in response.headers:
+            return response
+        if not response.is_streamed and len(response.get_data()) < COMPRESS_MIN_SIZE:
+            return response
+        chosen = response_compressor()
+        if chosen is None:
+            return response
+        encoding, compress, finish = chosen
+        
+        if response.is_streamed:
+            chunks = response.response
+            
+            def generate():
+                for chunk in chunks:
+                    data = compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+                    if data:
+                        yield data
+                yield finish()
+            response.response = generate()
+        else:
+            response.set_data(compress(response.get_data()) + finish())
+        response.headers['Content-Encoding'] = encoding
+        return response
+    return decorated_function
+
+
+def dialect_insert(model):
+    """INSERT construct with ON CONFLICT support for the active database"""
+    insert = postgresql_insert if db.engine.dialect.name == 'postgresql' else sqlite_insert
+    return insert(model)
+
+
+def adjust_monthly_rollup(user_id, expense_date, category, is_bill, amount, count):
+    """Add amount/count to a rollup bucket with an atomic upsert in the current transaction"""
+    stmt = dialect_insert(MonthlyRollup).values(
+        user_id=user_id,
+        month=expense_date.strftime('%Y-%m'),
+        category=category,
+        is_bill=bool(is_bill),
+        total=amount,
+        expense_count=count
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'month', 'category', 'is_bill'],
+        set_={
+            'total': MonthlyRollup.total + stmt.excluded.total,
+            'expense_count': MonthlyRollup.expense_count + stmt.excluded.expense_count
+        }
+    )
+    db.session.execute(stmt)
+
+
+def rollup_add(expense):
+    """Count an expense into its monthly rollup bucket"""
+    adjust_monthly_rollup(expense.user_id, expense.date, expense.category, expense.is_bill, expense.amount, 1)
+
+
+def rollup_remove(user_id, expense_date, category, is_bill, amount):
+    """Take an expense's old values back out of its monthly rollup bucket"""
+    adjust_monthly_rollup(user_id, expense_date, category, is_bill, -amount, -1)
+    MonthlyRollup.query.filter(
+        MonthlyRollup.user_id == user_id,
+        MonthlyRollup.month == expense_date.strftime('%Y-%m'),
+        MonthlyRollup.category == category,
+        MonthlyRollup.is_bill == bool(is_bill),
+        MonthlyRollup.expense_count <= 0
+    ).delete(synchronize_session=False)
+
+
+def add_rollup_delta(deltas, expense_date, category, is_bill, amount, count):
+    """Accumulate a change into a {(month_start, category, is_bill): (total, count)} dict"""
+    key = (expense_date.replace(day=1), category, bool(is_bill))
+    total, expense_count = deltas.get(key, (0.0, 0))
+    deltas[key] = (total + amount, expense_count + count)
+
+
+def apply_rollup_deltas(user_id, deltas):
+    """Apply accumulated rollup changes with one upsert per bucket and drop buckets left empty"""
+    for (month_start, category, is_bill), (total, count) in deltas.items():
+        if count or total:
+            adjust_monthly_rollup(user_id, month_start, category, is_bill, total, count)
+    if any(count < 0 for _, count in deltas.values()):
+        MonthlyRollup.query.filter(
+            MonthlyRollup.user_id == user_id,
+            MonthlyRollup.expense_count <= 0
+        ).delete(synchronize_session=False)
+
+
+def rollup_deltas_for_ids(user_id, expense_ids, sign, deltas=None):
+    """Grouped rollup contribution of a set of a user's expenses, scaled by sign (+1 or -1)"""
+    deltas = {} if deltas is None else deltas
+    year_col = db.extract('year', Expense.date)
+    month_col = db.extract('month', Expense.date)
+    rows = db.session.query(
+        year_col, month_col, Expense.category, Expense.is_bill,
+        db.func.sum(Expense.amount), db.func.count(Expense.id)
+    ).filter(
+        Expense.user_id == user_id,
+        Expense.id.in_(expense_ids)
+    ).group_by(year_col, month_col, Expense.category, Expense.is_bill).all()
+    for row_year, row_month, category, is_bill, total, count in rows:
+        add_rollup_delta(deltas, date(int(row_year), int(row_month), 1), category, is_bill,
+                         sign * float(total), sign * count)
+    return deltas
+
+
+def compute_rollups_from_expenses(user_id=None):
+    """Recompute rollup buckets from raw Expense rows, keyed by (user_id, month, category, is_bill)"""
+    year_col = db.extract('year', Expense.date)
+    month_col = db.extract('month', Expense.date)
+    query = db.session.query(
+        Expense.user_id, year_col, month_col, Expense.category, Expense.is_bill,
+        db.func.sum(Expense.amount), db.func.count(Expense.id)
+    )
+    if user_id is not None:
+        query = query.filter(Expense.user_id == user_id)
+    rows = query.group_by(Expense.user_id, year_col, month_col, Expense.category, Expense.is_bill).all()
+    
+    return {
+        (row_user_id, f'{int(row_year)}-{int(row_month):02d}', category, bool(is_bill)): (float(total), count)
+        for row_user_id, row_year, row_month, category, is_bill, total, count in rows
+    }
+
+
+def verify_monthly_rollups(user_id=None, tolerance=0.005):
+    """Compare stored rollups against a fresh recomputation and return the drifted buckets"""
+    expected = compute_rollups_from_expenses(user_id)
+    query = MonthlyRollup.query
+    if user_id is not None:
+        query = query.filter_by(user_id=user_id)
+    stored = {
+        (r.user_id, r.month, r.category, bool(r.is_bill)): (r.total, r.expense_count)
+        for r in query.all()
+    }
+    
+    drift = []
+    for key in sorted(set(expected) | set(stored), key=str):
+        expected_total, expected_count = expected.get(key, (0.0, 0))
+        stored_total, stored_count = stored.get(key, (0.0, 0))
+        if abs(expected_total - stored_total) > tolerance or expected_count != stored_count:
+            drift.append({
+                'user_id': key[0], 'month': key[1], 'category': key[2], 'is_bill': key[3],
+                'expected_total': expected_total, 'stored_total': stored_total,
+                'expected_count': expected_count, 'stored_count': stored_count
+            })
+    return drift
+
+
+def rebuild_monthly_rollups(user_id=None):
+    """Replace stored rollups with a full recomputation; returns the number of buckets written"""
+    expected = compute_rollups_from_expenses(user_id)
+    query = MonthlyRollup.query
+    if user_id is not None:
+        query = query.filter_by(user_id=user_id)
+    query.delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(MonthlyRollup, [
+        {'user_id': key[0], 'month': key[1], 'category': key[2], 'is_bill': key[3],
+         'total': total, 'expense_count': count}
+        for key, (total, count) in expected.items()
+    ])
+    db.session.commit()
+    return len(expected)
+
+
+def monthly_budget_report(year, month_num, limits, user_id=None):
+    """
+    budget_data for a report email, totalled from the rollup table in one query.
+
+    Args:
+        year: Report year
+        month_num: Report month (1-12)
+        limits: Budget limits dict, as returned by budget_limits_for_month()
+        user_id: Limit the totals to one user (all users when None)
+    """
+    statement = category_totals_statement(
+        MonthlyRollup.category, MonthlyRollup.is_bill, MonthlyRollup.total
+    ).where(MonthlyRollup.month == f'{year}-{month_num:02d}')
+    if user_id is not None:
+        statement = statement.where(MonthlyRollup.user_id == user_id)
+    rows = db.session.execute(statement).all()
+    return build_budget_data(datetime(year, month_num, 1).strftime('%B %Y'), rows, limits)
+
+
+def monthly_budget_reports(year, month_num, user_ids):
+    """
+    budget_data for many users at once: one grouped rollup query and one budget
+    limit query for the whole batch, instead of two queries per user.
+
+    Returns:
+        Dict of user_id -> budget_data, with an entry for every requested user
+    """
+    month = f'{year}-{month_num:02d}'
+    statement = category_totals_statement(
+        MonthlyRollup.category, MonthlyRollup.is_bill, MonthlyRollup.total
+    ).add_columns(MonthlyRollup.user_id).where(
+        MonthlyRollup.month == month, MonthlyRollup.user_id.in_(user_ids)
+    ).group_by(MonthlyRollup.user_id)
+    rows_by_user = {user_id: [] for user_id in user_ids}
+    for row in db.session.execute(statement):
+        rows_by_user[row[-1]].append(row[:-1])
+    
+    limits_by_user = {
+        budget_limit.user_id: budget_limit.to_dict()
+        for budget_limit in BudgetLimit.query.filter(BudgetLimit.month == month, BudgetLimit.user_id.in_(user_ids))
+    }
+    month_display = datetime(year, month_num, 1).strftime('%B %Y')
+    return {
+        user_id: build_budget_data(month_display, rows, limits_by_user.get(user_id, DEFAULT_BUDGET_LIMITS))
+        for user_id, rows in rows_by_user.items()
+    }
+
+
+@app.cli.command('prune-tombstones')
+def prune_tombstones_command():
+    """Delete delta-sync tombstones older than TOMBSTONE_RETENTION_DAYS"""
+    pruned = prune_expense_tombstones()
+    print(f"✓ Pruned {pruned} expense tombstones older than {TOMBSTONE_RETENTION_DAYS} days")
+
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the monthly rollup table from scratch"""
+    drift = verify_monthly_rollups()
+    count = rebuild_monthly_rollups()
+    print(f"✓ Rebuilt {count} monthly rollup buckets ({len(drift)} had drifted)")
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Re-index every expense for full-text search (SQLite; PostgreSQL's index needs no rebuild)"""
+    if db.engine.dialect.name != 'sqlite':
+        print("✓ PostgreSQL maintains the search index itself")
+        return
+    db.session.execute(db.text("INSERT INTO expense_fts (expense_fts) VALUES ('rebuild')"))
+    db.session.commit()
+    print("✓ Rebuilt the expense search index")
+
+
+@app.cli.command('verify-rollups')
+def verify_rollups_command():
+    """Report monthly rollup buckets that no longer match the expense table"""
+    drift = verify_monthly_rollups()
+    if not drift:
+        print("✓ Monthly rollups match the expense table")
+        return
+    print(f"⚠️  {len(drift)} monthly rollup buckets have drifted:")
+    for item in drift:
+        print(f"   user={item['user_id']} {item['month']} {item['category']} bill={item['is_bill']}: "
+              f"stored {item['stored_total']:.2f} ({item['stored_count']}) / "
+              f"expected {item['expected_total']:.2f} ({item['expected_count']})")
+    raise SystemExit(1)
+
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -213,36 +994,699 @@ def index():
 
 @app.route('/api/expenses', methods=['GET'])
 @login_required
+@etag_by_data_version
+@compress_response
 def get_expenses():
     user_id = get_current_user_id()
     month = request.args.get('month')  # Format: YYYY-MM
     year = request.args.get('year')
+    try:
+        columnar = wants_columnar()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    expenses = Expense.query.filter_by(user_id=user_id)
+    expenses = db.select(*EXPENSE_READ_COLUMNS).where(Expense.user_id == user_id)
     
-    if month and year:
-        # Filter by specific month and year
-        expenses = expenses.filter(
-            Expense.date.like(f'{year}-{month}%')
-        )
-    elif month:
-        # Filter by month in current year
-        current_year = datetime.now().year
-        expenses = expenses.filter(
-            Expense.date.like(f'{current_year}-{month}%')
-        )
+    try:
+        if month and year:
+            # Filter by specific month and year
+            expenses = filter_by_month(expenses, year, month)
+        elif month:
+            # Filter by month in current year
+            current_year = datetime.now().year
+            expenses = filter_by_month(expenses, current_year, month)
+    except ValueError:
+        return jsonify({'error': 'Expected month=<1-12> and year=YYYY'}), 400
     
-    expenses = expenses.order_by(Expense.date.desc(), Expense.created_at.desc()).all()
-    return jsonify([expense.to_dict() for expense in expenses])
+    limit = request.args.get('limit')
+    if not limit:
+        expenses = expenses.order_by(Expense.date.desc(), Expense.created_at.desc())
+        if columnar:
+            return expense_columns_response(expenses)
+        return stream_expense_rows(expenses)
+    
+    # Keyset pagination: seek past the cursor row instead of using OFFSET,
+    # so every page is an index range scan of at most limit + 1 rows
+    try:
+        limit = int(limit)
+        if not 1 <= limit <= 500:
+            raise ValueError('limit must be between 1 and 500')
+        cursor = request.args.get('cursor')
+        if cursor:
+            expenses = expenses.where(
+                db.tuple_(Expense.date, Expense.created_at, Expense.id) < db.tuple_(*decode_expense_cursor(cursor))
+            )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    page = db.session.execute(expenses.order_by(
+        Expense.date.desc(), Expense.created_at.desc(), Expense.id.desc()
+    ).limit(limit + 1)).all()
+    has_more = len(page) > limit
+    page = page[:limit]
+    
+    return jsonify({
+        'expenses': expense_columns(page) if columnar else expense_row_dicts(page),
+        'next_cursor': encode_expense_cursor(page[-1]) if has_more else None
+    })
+
+
+EXPENSE_QUERY_FLAGS = ('is_recurring', 'is_active', 'is_bill')
+EXPENSE_QUERY_DEFAULT_LIMIT = 100
+
+
+def parse_flag(name, value):
+    """Parse a true/false query parameter"""
+    lowered = value.lower()
+    if lowered in ('1', 'true', 'yes'):
+        return True
+    if lowered in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'{name} must be true or false')
+
+
+def build_expense_query(user_id, args):
+    """
+    Build the filtered, sorted, paged SELECT behind /api/expenses/query.
+
+    Every filter is an indexable predicate on the expense table: category and
+    subcategory sets become IN lists, amounts and dates half-open or inclusive
+    ranges, and flags are spelled .is_(value) so the partial recurring index
+    matches. Each sort follows the column order of an index (EXPENSE_QUERY_SORTS),
+    so pages are read in order rather than sorted.
+
+    Args:
+        args: Request arguments; category and subcategory may repeat or be comma-separated
+
+    Returns:
+        (statement fetching limit + 1 rows, sort key, limit); raises ValueError for bad arguments
+    """
+    statement = db.select(Expense).where(Expense.user_id == user_id)
+
+    categories, subcategories = (
+        list(dict.fromkeys(value for raw in args.getlist(name) for value in raw.split(',') if value))
+        for name in ('category', 'subcategory')
+    )
+    if subcategories:
+        statement = statement.where(Expense.subcategory.in_(subcategories))
+
+    for name in ('min_amount', 'max_amount'):
+        value = args.get(name)
+        if value:
+            try:
+                amount = float(value)
+            except ValueError:
+                raise ValueError(f'{name} must be a number')
+            statement = statement.where(Expense.amount >= amount if name == 'min_amount' else Expense.amount <= amount)
+
+    for name in EXPENSE_QUERY_FLAGS:
+        value = args.get(name)
+        if value:
+            statement = statement.where(getattr(Expense, name).is_(parse_flag(name, value)))
+
+    month, year = args.get('month'), args.get('year')
+    if month and year:
+        first, next_first = month_bounds(year, month)
+        statement = statement.where(Expense.date >= first, Expense.date < next_first)
+    if args.get('from'):
+        statement = statement.where(Expense.date >= parse_date(args['from']))
+    if args.get('to'):
+        statement = statement.where(Expense.date <= parse_date(args['to']))
+
+    sort = args.get('sort', 'date')
+    if sort not in EXPENSE_QUERY_SORTS:
+        raise ValueError(f"sort must be one of {', '.join(EXPENSE_QUERY_SORTS)}")
+    order = args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        raise ValueError('order must be asc or desc')
+    limit = int(args.get('limit', EXPENSE_QUERY_DEFAULT_LIMIT))
+    if not 1 <= limit <= 500:
+        raise ValueError('limit must be between 1 and 500')
+
+    columns = [getattr(Expense, name) for name in EXPENSE_QUERY_SORTS[sort]]
+    cursor = args.get('cursor')
+    if cursor:
+        key, after = db.tuple_(*columns), db.tuple_(*decode_query_cursor(cursor, sort))
+        statement = statement.where(key < after if order == 'desc' else key > after)
+
+    if sort == 'date' and len(categories) > 1:
+        # An IN list over ix_expense_user_category_date yields one date-ordered
+        # run per category, which the database would have to sort whole. Read
+        # each category as its own branch in index order instead and merge the
+        # runs. SQLite merges a compound SELECT on its ORDER BY directly;
+        # PostgreSQL only merges branches that are ordered and limited themselves
+        branches = [statement.where(Expense.category == category) for category in categories]
+        if db.engine.dialect.name == 'postgresql':
+            branches = [
+                db.select(branch.order_by(*(column.desc() if order == 'desc' else column.asc() for column in columns))
+                          .limit(limit + 1).subquery())
+                for branch in branches
+            ]
+        merged = db.aliased(Expense, db.union_all(*branches).subquery('expense'))
+        statement = db.select(merged)
+        columns = [getattr(merged, name) for name in EXPENSE_QUERY_SORTS[sort]]
+    elif categories:
+        statement = statement.where(Expense.category.in_(categories))
+
+    statement = statement.order_by(*(column.desc() if order == 'desc' else column.asc() for column in columns))
+    return statement.limit(limit + 1), sort, limit
+
+
+@app.route('/api/expenses/query', methods=['GET'])
+@login_required
+@etag_by_data_version
+def query_expenses():
+    """
+    Filter and sort expenses on the server.
+
+    Query parameters (all optional): category and subcategory (repeat or
+    comma-separate for several), min_amount / max_amount (inclusive),
+    is_recurring / is_active / is_bill (true/false), month + year or an
+    inclusive from / to date range, sort (date, amount, category; default
+    date), order (asc, desc; default desc), limit (1-500, default 100) and
+    cursor (from the previous page).
+    Returns {"expenses": [...], "next_cursor": ...}.
+    """
+    user_id = get_current_user_id()
+    try:
+        statement, sort, limit = build_expense_query(user_id, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    page = db.session.scalars(statement).all()
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    return jsonify({
+        'expenses': [expense.to_dict() for expense in page],
+        'next_cursor': encode_query_cursor(sort, page[-1]) if has_more else None
+    })
 
 
 @app.route('/api/expenses/all', methods=['GET'])
 @login_required
+@etag_by_data_version
+@compress_response
 def get_all_expenses():
     """Get all expenses for charts and analysis"""
     user_id = get_current_user_id()
-    expenses = Expense.query.filter_by(user_id=user_id).order_by(Expense.date.asc()).all()
-    return jsonify([expense.to_dict() for expense in expenses])
+    try:
+        columnar = wants_columnar()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    expenses = db.select(*EXPENSE_READ_COLUMNS).where(Expense.user_id == user_id).order_by(Expense.date.asc())
+    if columnar:
+        return expense_columns_response(expenses)
+    return stream_expense_rows(expenses)
+
+
+@app.route('/api/expenses/changes', methods=['GET'])
+@login_required
+@etag_by_data_version
+@compress_response
+def get_expense_changes():
+    """
+    Expenses created, updated or deleted after a sync token.
+
+    The token is the user's data version. Without `since` every expense is
+    returned, so a client starts with a full copy and then only asks for deltas:
+    {"version": <next token>, "expenses": [...changed rows...], "deleted": [ids]}
+    With format=columnar, `expenses` comes as parallel arrays (see expense_columns).
+    Clients apply `deleted` before `expenses`: SQLite may reuse a deleted id,
+    and every row in `expenses` exists as of this response.
+    A token older than the kept deletion history (TOMBSTONE_RETENTION_DAYS)
+    gets a 410 with "resync": true; the client starts over without `since`.
+    """
+    user_id = get_current_user_id()
+    since = request.args.get('since')
+    try:
+        since = int(since) if since else None
+    except ValueError:
+        return jsonify({'error': 'since must be a version number'}), 400
+    try:
+        columnar = wants_columnar()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Read the version first: anything committed after this point has a higher
+    # version and is picked up by the next sync, at worst twice
+    version = db.session.query(User.data_version).filter(User.id == user_id).scalar()
+    
+    expenses = db.select(*EXPENSE_READ_COLUMNS).where(Expense.user_id == user_id)
+    deleted = []
+    if since is not None:
+        expenses = expenses.where(Expense.version > since)
+        deleted = [row[0] for row in db.session.query(ExpenseTombstone.expense_id).filter(
+            ExpenseTombstone.user_id == user_id, ExpenseTombstone.version > since
+        )]
+        # Read after the tombstones: pruning raises the floor in the same commit
+        # that deletes them, so a floor at or below `since` means none were missed
+        tombstone_floor = db.session.query(User.tombstone_floor).filter(User.id == user_id).scalar()
+        if since < tombstone_floor:
+            return jsonify({
+                'error': 'since is older than the kept deletion history; sync again without it',
+                'resync': True
+            }), 410
+    
+    expenses = db.session.execute(expenses).all()
+    return jsonify({
+        'version': version,
+        'expenses': expense_columns(expenses) if columnar else expense_row_dicts(expenses),
+        'deleted': deleted
+    })
+
+
+# Words searched per query; each one is prefix-matched
+SEARCH_MAX_TERMS = 8
+SEARCH_DEFAULT_LIMIT = 50
+
+
+def search_terms(query):
+    """Lowercased words of a search box query, punctuation dropped"""
+    return re.findall(r'\w+', query.lower())[:SEARCH_MAX_TERMS]
+
+
+def search_expense_ids(user_id, terms, after, limit):
+    """
+    Rank a user's expenses against search terms, best match first.
+    
+    Every term must match the description or subcategory, as a prefix, so
+    "star cof" finds "Starbucks coffee". Ranks are bm25 on SQLite and negated
+    ts_rank on PostgreSQL, so lower is better on both and ties break on id.
+    
+    Args:
+        user_id: Whose expenses to search
+        terms: Output of search_terms()
+        after: (rank, id) of the last row on the previous page, or None
+        limit: Rows to return
+    
+    Returns:
+        List of (expense_id, rank)
+    """
+    params = {'user_id': user_id, 'limit': limit}
+    if db.engine.dialect.name == 'postgresql':
+        params['query'] = ' & '.join(f"'{term}':*" for term in terms)
+        ranked = f"""
+            SELECT id, -ts_rank({EXPENSE_SEARCH_VECTOR}, query)::float8 AS rank
+            FROM expense, to_tsquery('simple', :query) AS query
+            WHERE user_id = :user_id AND {EXPENSE_SEARCH_VECTOR} @@ query
+        """
+    else:
+        # user_id is matched through the index as well; the other two columns
+        # carry the search terms, and user_id gets no weight in the ranking
+        params['query'] = f'user_id : "{user_id}" AND {{description subcategory}} : (' + \
+            ' '.join(f'"{term}" *' for term in terms) + ')'
+        ranked = """
+            SELECT rowid AS id, bm25(expense_fts, 2.0, 1.0, 0.0) AS rank
+            FROM expense_fts WHERE expense_fts MATCH :query
+        """
+    page = ''
+    if after is not None:
+        params['after_rank'], params['after_id'] = after
+        page = 'WHERE rank > :after_rank OR (rank = :after_rank AND id > :after_id)'
+    return db.session.execute(
+        db.text(f'SELECT id, rank FROM ({ranked}) AS ranked {page} ORDER BY rank, id LIMIT :limit'),
+        params
+    ).all()
+
+
+@app.route('/api/expenses/search', methods=['GET'])
+@login_required
+@etag_by_data_version
+def search_expenses():
+    """
+    Full-text search across all of the user's expenses.
+    
+    Query parameters: q (required), limit (1-200, default 50), cursor (from
+    the previous page). Returns {"expenses": [...], "next_cursor": ...} with
+    the best matches first.
+    """
+    user_id = get_current_user_id()
+    terms = search_terms(request.args.get('q', ''))
+    if not terms:
+        return jsonify({'error': 'q must contain at least one word'}), 400
+    try:
+        limit = int(request.args.get('limit', SEARCH_DEFAULT_LIMIT))
+        if not 1 <= limit <= 200:
+            raise ValueError('limit must be between 1 and 200')
+        cursor = request.args.get('cursor')
+        after = decode_search_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    ranked = search_expense_ids(user_id, terms, after, limit + 1)
+    has_more = len(ranked) > limit
+    ranked = ranked[:limit]
+    expenses = {expense.id: expense for expense in Expense.query.filter(
+        Expense.user_id == user_id, Expense.id.in_([expense_id for expense_id, _ in ranked])
+    )}
+    
+    return jsonify({
+        'expenses': [expenses[expense_id].to_dict() for expense_id, _ in ranked if expense_id in expenses],
+        'next_cursor': encode_search_cursor(ranked[-1][1], ranked[-1][0]) if has_more else None
+    })
+
+
+@app.route('/api/analytics/monthly', methods=['GET'])
+@login_required
+@etag_by_data_version
+def get_monthly_analytics():
+    """Monthly spending totals per category for a window of months, read from the rollup table"""
+    user_id = get_current_user_id()
+    end_month = request.args.get('end') or datetime.now().strftime('%Y-%m')
+    
+    try:
+        months = int(request.args.get('months', 6))
+        end_year, end_month_num = (int(part) for part in end_month.split('-'))
+        month_bounds(end_year, end_month_num)  # Raises ValueError for an invalid month
+    except ValueError:
+        return jsonify({'error': 'Expected months=<1-60> and end=YYYY-MM'}), 400
+    
+    if not 1 <= months <= 60:
+        return jsonify({'error': 'months must be between 1 and 60'}), 400
+    
+    trend = monthly_trend(user_id, end_year, end_month_num, months)
+    return jsonify({
+        'start': trend[0]['month'],
+        'end': trend[-1]['month'],
+        'excluded_categories': EXCLUDED_SPENDING_CATEGORIES,
+        'months': trend
+    })
+
+
+def monthly_trend(user_id, end_year, end_month_num, months):
+    """
+    Spending totals per month and category from the rollup table, oldest first.
+
+    Args:
+        user_id: User whose rollups to read
+        end_year: Year of the last month in the window
+        end_month_num: Last month in the window (1-12)
+        months: Number of months in the window, ending with end_year/end_month_num
+
+    Returns:
+        List of {'month': 'YYYY-MM', 'total': float, 'categories': {category: total}},
+        with zero entries for months without expenses
+    """
+    # Build the month keys oldest-first so empty months still show up as zero
+    month_keys = []
+    year, month_num = end_year, end_month_num
+    for _ in range(months):
+        month_keys.append((year, month_num))
+        year, month_num = (year - 1, 12) if month_num == 1 else (year, month_num - 1)
+    month_keys.reverse()
+    
+    rows = db.session.query(
+        MonthlyRollup.month, MonthlyRollup.category, db.func.sum(MonthlyRollup.total)
+    ).filter(
+        MonthlyRollup.user_id == user_id,
+        MonthlyRollup.month >= f'{month_keys[0][0]}-{month_keys[0][1]:02d}',
+        MonthlyRollup.month <= f'{end_year}-{end_month_num:02d}',
+        MonthlyRollup.category.notin_(EXCLUDED_SPENDING_CATEGORIES)
+    ).group_by(MonthlyRollup.month, MonthlyRollup.category).all()
+    
+    results = {
+        f'{y}-{m:02d}': {'month': f'{y}-{m:02d}', 'total': 0.0, 'categories': {}}
+        for y, m in month_keys
+    }
+    for row_month, category, total in rows:
+        bucket = results[row_month]
+        bucket['categories'][category] = float(total)
+        bucket['total'] += float(total)
+    return list(results.values())
+
+
+# Users whose analytics arrays stay in memory, per process; each costs 23 bytes
+# per expense in arrays, about 35 MB of RSS for a million expenses
+ANALYTICS_CACHE_SIZE = int(os.environ.get('ANALYTICS_CACHE_SIZE', '8'))
+EPOCH = date(1970, 1, 1)
+
+_analytics_cache = OrderedDict()
+_analytics_cache_lock = threading.Lock()
+
+
+def expense_day_number():
+    """Expense.date as days since 1970-01-01, computed by the database"""
+    if db.engine.dialect.name == 'postgresql':
+        return Expense.date - EPOCH
+    # julianday('1970-01-01') is 2440587.5, and every date lands on a .5
+    return db.cast(db.func.julianday(Expense.date) - 2440587.5, db.Integer)
+
+
+def load_expense_arrays(user_id):
+    """All of a user's expenses as analytics.ExpenseArrays, straight from the database"""
+    result = db.session.connection().execute(
+        db.select(expense_day_number(), Expense.category, Expense.subcategory, Expense.amount, Expense.is_bill)
+        .where(Expense.user_id == user_id)
+    )
+    # Every column is already an int, str, float or bool from the driver, so the
+    # DBAPI tuples are read directly rather than built into Row objects
+    rows = result.cursor.fetchall()
+    result.close()
+    return ExpenseArrays.from_rows(rows)
+
+
+def user_expense_arrays(user_id):
+    """
+    All of a user's expenses as analytics.ExpenseArrays, loaded once per data version.
+
+    Arrays are cached per process under (user_id, data_version). Every write
+    bumps the version, so a cached entry is never stale, only unused; the
+    least recently used users are dropped beyond ANALYTICS_CACHE_SIZE.
+    """
+    version = db.session.query(User.data_version).filter(User.id == user_id).scalar()
+    key = (user_id, version)
+    with _analytics_cache_lock:
+        arrays = _analytics_cache.get(key)
+        if arrays is not None:
+            _analytics_cache.move_to_end(key)
+            return arrays
+    
+    arrays = load_expense_arrays(user_id)
+    
+    with _analytics_cache_lock:
+        for stale in [cached for cached in _analytics_cache if cached[0] == user_id]:
+            del _analytics_cache[stale]
+        _analytics_cache[key] = arrays
+        while len(_analytics_cache) > ANALYTICS_CACHE_SIZE:
+            _analytics_cache.popitem(last=False)
+    return arrays
+
+
+def json_floats(values):
+    """Float array as a JSON-ready list, NaN as null"""
+    return [None if value != value else float(value) for value in values.tolist()]
+
+
+@app.route('/api/analytics/trend', methods=['GET'])
+@login_required
+@etag_by_data_version
+def get_analytics_trend():
+    """
+    Spending trend over a window of months, computed from every expense.
+
+    Query params: end=YYYY-MM (default this month), months=1-120 (default 12)
+    and window=1-12 (months in the rolling average, default 3). Spending
+    leaves out Income, Investment and Payment, as in the rollup trend.
+    Returns per month: total, fixed and variable spending, the rolling
+    average, the change from the month before (absolute and percent) and
+    the total per category.
+    """
+    user_id = get_current_user_id()
+    end_month = request.args.get('end') or datetime.now().strftime('%Y-%m')
+    try:
+        months = int(request.args.get('months', 12))
+        window = int(request.args.get('window', 3))
+        end_year, end_month_num = (int(part) for part in end_month.split('-'))
+        month_bounds(end_year, end_month_num)  # Raises ValueError for an invalid month
+    except ValueError:
+        return jsonify({'error': 'Expected end=YYYY-MM, months=<1-120> and window=<1-12>'}), 400
+    if not 1 <= months <= 120 or not 1 <= window <= 12:
+        return jsonify({'error': 'months must be between 1 and 120 and window between 1 and 12'}), 400
+    
+    arrays = user_expense_arrays(user_id)
+    last = month_index(end_year, end_month_num)
+    # Start early enough that the first month has a full rolling window and a previous month
+    lead = max(window - 1, 1)
+    first = last - months + 1 - lead
+    spending = arrays.spending_mask()
+    totals, per_category = monthly_series(arrays, first, last, spending)
+    fixed, _ = monthly_series(arrays, first, last, spending & arrays.fixed_mask())
+    average = rolling_mean(totals, window)
+    change, change_percent = month_over_month(totals)
+    
+    shown = slice(lead, None)
+    category_totals_in_window = per_category[shown].sum(axis=0)
+    return jsonify({
+        'months': [month_label(index) for index in range(first + lead, last + 1)],
+        'window': window,
+        'total': json_floats(totals[shown]),
+        'fixed': json_floats(fixed[shown]),
+        'variable': json_floats(totals[shown] - fixed[shown]),
+        'rolling_average': json_floats(average[shown]),
+        'change': json_floats(change[shown]),
+        'change_percent': json_floats(change_percent[shown]),
+        'categories': {
+            category: json_floats(per_category[shown, code])
+            for code, category in enumerate(arrays.categories) if category_totals_in_window[code]
+        }
+    })
+
+
+@app.route('/api/analytics/categories', methods=['GET'])
+@login_required
+@etag_by_data_version
+def get_analytics_categories():
+    """
+    Totals per category and subcategory over any date range.
+
+    Query params: from / to (YYYY-MM-DD, inclusive, both optional; default
+    all history). Categories come largest first; share is the fraction of
+    spending, and null for Income, Investment and Payment.
+    """
+    user_id = get_current_user_id()
+    try:
+        start_day = (parse_date(request.args['from']) - EPOCH).days if request.args.get('from') else None
+        end_day = (parse_date(request.args['to']) - EPOCH).days + 1 if request.args.get('to') else None
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    
+    arrays = user_expense_arrays(user_id)
+    in_range = arrays.day_mask(start_day, end_day)
+    spending_total = float(arrays.amount[in_range & arrays.spending_mask()].sum())
+    subcategories = subcategory_totals(arrays, in_range)
+    
+    return jsonify({
+        'spending_total': spending_total,
+        'categories': [{
+            'category': category,
+            'total': total,
+            'count': count,
+            'share': total / spending_total if spending_total and category not in EXCLUDED_SPENDING_CATEGORIES else None,
+            'subcategories': [{'subcategory': name, 'total': value} for name, value in subcategories[category]]
+        } for category, total, count in category_totals(arrays, in_range)]
+    })
+
+
+# Months of history in the dashboard's trend chart
+DASHBOARD_TREND_MONTHS = 6
+
+
+@app.route('/api/dashboard', methods=['GET'])
+@login_required
+@etag_by_data_version
+@compress_response
+def get_dashboard():
+    """
+    Everything the month view needs in one round trip.
+
+    Query params: month=YYYY-MM (the month being viewed) and current=YYYY-MM
+    (the client's current month, defaulting to the server's). The trend ends
+    at the current month, matching the chart. With format=columnar the
+    expenses come as parallel arrays (see expense_columns); expenses=0 leaves
+    them out, for clients that keep their own copy through
+    /api/expenses/changes. A read only: recurring expenses are generated by
+    POST /api/expenses/generate-recurring.
+    """
+    user_id = get_current_user_id()
+    current = request.args.get('current') or datetime.now().strftime('%Y-%m')
+    month = request.args.get('month') or current
+    
+    try:
+        columnar = wants_columnar()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        year, month_num = (int(part) for part in month.split('-'))
+        current_year, current_month_num = (int(part) for part in current.split('-'))
+        # Raise ValueError for an invalid month
+        month_bounds(year, month_num)
+        month_bounds(current_year, current_month_num)
+    except ValueError:
+        return jsonify({'error': 'month and current must be in YYYY-MM format'}), 400
+    month = f'{year}-{month_num:02d}'
+    previous_year, previous_month_num = (year - 1, 12) if month_num == 1 else (year, month_num - 1)
+    
+    version = db.session.query(User.data_version).filter(User.id == user_id).scalar()
+    dashboard = {
+        'month': month,
+        'version': version,
+        'budget_limits': budget_limits_for_month(user_id, month),
+        'previous_month': monthly_trend(user_id, previous_year, previous_month_num, 1)[0],
+        'trend': monthly_trend(user_id, current_year, current_month_num, DASHBOARD_TREND_MONTHS)
+    }
+    if request.args.get('expenses') != '0':
+        expenses = db.session.execute(filter_by_month(
+            db.select(*EXPENSE_READ_COLUMNS).where(Expense.user_id == user_id), year, month_num
+        ).order_by(Expense.date.desc(), Expense.created_at.desc())).all()
+        dashboard['expenses'] = expense_columns(expenses) if columnar else expense_row_dicts(expenses)
+    return jsonify(dashboard)
+
+
+def generate_recurring_for_month(user_id, month_start, next_month_start):
+    """
+    Create the month's missing instances of a user's active recurring expenses.
+
+    One anti-join query finds the (description, category, amount) templates with
+    no expense in the month. Each instance is then claimed in the
+    RecurringGeneration ledger with INSERT ... ON CONFLICT DO NOTHING, so when
+    several workers run this at once only the one that claims a row inserts it.
+    Bumps the user's data version when anything is generated.
+    Returns the number of expenses generated; the caller commits.
+    """
+    instance = db.aliased(Expense)
+    already_present = db.exists().where(
+        instance.user_id == user_id,
+        instance.description == Expense.description,
+        instance.category == Expense.category,
+        instance.amount == Expense.amount,
+        instance.date >= month_start,
+        instance.date < next_month_start
+    )
+    missing = db.session.query(
+        Expense.description, Expense.category, Expense.amount,
+        db.func.max(db.case((Expense.is_bill, 1), else_=0))
+    ).filter(
+        Expense.user_id == user_id,
+        Expense.is_recurring.is_(True),
+        Expense.is_active.is_(True),
+        ~already_present
+    ).group_by(Expense.description, Expense.category, Expense.amount).all()
+    
+    if not missing:
+        return 0
+    
+    month = month_start.strftime('%Y-%m')
+    is_bill_by_key = {(description, category, amount): bool(is_bill) for description, category, amount, is_bill in missing}
+    claim = dialect_insert(RecurringGeneration).values([
+        {'user_id': user_id, 'month': month, 'description': description, 'category': category,
+         'amount': amount, 'created_at': datetime.utcnow()}
+        for description, category, amount in is_bill_by_key
+    ]).on_conflict_do_nothing(
+        index_elements=['user_id', 'month', 'description', 'category', 'amount']
+    ).returning(RecurringGeneration.description, RecurringGeneration.category, RecurringGeneration.amount)
+    claimed = db.session.execute(claim).all()
+    
+    if not claimed:
+        return 0
+    
+    version = bump_data_version(user_id)
+    now = datetime.utcnow()
+    db.session.execute(db.insert(Expense), [
+        {'user_id': user_id, 'date': month_start, 'category': category, 'subcategory': None,
+         'description': description, 'amount': amount, 'is_recurring': True, 'is_active': True,
+         'is_bill': is_bill_by_key[(description, category, amount)], 'created_at': now,
+         'updated_at': now, 'version': version}
+        for description, category, amount in claimed
+    ])
+    
+    rollup_deltas = {}
+    for description, category, amount in claimed:
+        add_rollup_delta(rollup_deltas, month_start, category, is_bill_by_key[(description, category, amount)], amount, 1)
+    apply_rollup_deltas(user_id, rollup_deltas)
+    
+    return len(claimed)
 
 
 @app.route('/api/expenses/generate-recurring', methods=['POST'])
@@ -255,43 +1699,14 @@ def generate_recurring_expenses():
     if not target_month:
         return jsonify({'error': 'Month parameter required'}), 400
     
-    # Get all active recurring expenses for current user
-    user_id = get_current_user_id()
-    recurring_expenses = Expense.query.filter_by(
-        user_id=user_id,
-        is_recurring=True,
-        is_active=True
-    ).all()
-    
-    generated_count = 0
+    try:
+        target_year, target_month_num = (int(part) for part in target_month.split('-'))
+        month_start, next_month_start = month_bounds(target_year, target_month_num)
+    except ValueError:
+        return jsonify({'error': 'Month must be in YYYY-MM format'}), 400
     
-    for recurring in recurring_expenses:
-        # Check if expense already exists for this month
-        existing = Expense.query.filter(
-            Expense.user_id == user_id,
-            Expense.description == recurring.description,
-            Expense.category == recurring.category,
-            Expense.amount == recurring.amount,
-            Expense.date.like(f'{target_month}%')
-        ).first()
-        
-        if not existing:
-            # Generate new expense for this month
-            # Use first day of the month
-            new_date = f"{target_month}-01"
-            
-            new_expense = Expense(
-                user_id=user_id,
-                date=new_date,
-                category=recurring.category,
-                description=recurring.description,
-                amount=recurring.amount,
-                is_recurring=True,
-                is_active=True,
-                is_bill=recurring.is_bill
-            )
-            db.session.add(new_expense)
-            generated_count += 1
+    user_id = get_current_user_id()
+    generated_count = generate_recurring_for_month(user_id, month_start, next_month_start)
     
     db.session.commit()
     return jsonify({'generated': generated_count})
@@ -309,18 +1724,25 @@ def add_expense():
     # is_bill is only relevant for subscriptions
     is_bill = data.get('is_bill', False) if category == 'Subscription' else False
     
+    try:
+        expense_date = parse_date(data['date'])
+    except ValueError:
+        return jsonify({'error': 'Date must be in YYYY-MM-DD format'}), 400
+    
     expense = Expense(
         user_id=user_id,
-        date=data['date'],
+        date=expense_date,
         category=category,
         subcategory=data.get('subcategory'),  # Optional subcategory
         description=data['description'],
         amount=float(data['amount']),
         is_recurring=is_recurring,
         is_active=is_active,
-        is_bill=is_bill
+        is_bill=is_bill,
+        version=bump_data_version(user_id)
     )
     db.session.add(expense)
+    rollup_add(expense)
     db.session.commit()
     return jsonify(expense.to_dict()), 201
 
@@ -328,10 +1750,17 @@ def add_expense():
 @app.route('/api/expenses/<int:expense_id>', methods=['PUT'])
 @login_required
 def update_expense(expense_id):
-    expense = Expense.query.get_or_404(expense_id)
+    user_id = get_current_user_id()
+    expense = Expense.query.filter_by(id=expense_id, user_id=user_id).first_or_404()
     data = request.json
     
-    expense.date = data['date']
+    try:
+        new_date = parse_date(data['date'])
+    except ValueError:
+        return jsonify({'error': 'Date must be in YYYY-MM-DD format'}), 400
+    
+    rollup_remove(user_id, expense.date, expense.category, expense.is_bill, expense.amount)
+    expense.date = new_date
     expense.category = data['category']
     expense.subcategory = data.get('subcategory')  # Optional subcategory
     expense.description = data['description']
@@ -343,6 +1772,8 @@ def update_expense(expense_id):
         expense.is_bill = data.get('is_bill', False)
     else:
         expense.is_bill = False
+    expense.version = bump_data_version(user_id)
+    rollup_add(expense)
     
     db.session.commit()
     return jsonify(expense.to_dict()), 200
@@ -356,7 +1787,9 @@ def cancel_subscription(expense_id):
     if expense.category != 'Subscription':
         return jsonify({'error': 'Only subscriptions can be cancelled'}), 400
     
+    # Rollup totals don't depend on is_active, so cancelling leaves them unchanged
     expense.is_active = False
+    expense.version = bump_data_version(user_id)
     db.session.commit()
     return jsonify(expense.to_dict()), 200
 
@@ -366,64 +1799,415 @@ def cancel_subscription(expense_id):
 def delete_expense(expense_id):
     user_id = get_current_user_id()
     expense = Expense.query.filter_by(id=expense_id, user_id=user_id).first_or_404()
+    rollup_remove(expense.user_id, expense.date, expense.category, expense.is_bill, expense.amount)
+    record_tombstones(user_id, [expense.id], bump_data_version(user_id))
     db.session.delete(expense)
     db.session.commit()
     return jsonify({'message': 'Expense deleted successfully'}), 200
 
 
-@app.route('/api/export/csv')
+# Upper bounds for a single POST /api/expenses/batch request
+BATCH_MAX_OPERATIONS = 100
+BATCH_MAX_ROWS_PER_OPERATION = 1000
+BATCH_UPDATABLE_FIELDS = {'date', 'category', 'subcategory', 'description', 'amount', 'is_recurring', 'is_active', 'is_bill'}
+
+
+class BatchError(ValueError):
+    """A batch operation is invalid; the whole batch is rolled back"""
+
+
+def _batch_ids(operation):
+    ids = operation.get('ids')
+    if not isinstance(ids, list) or not ids:
+        raise BatchError("'ids' must be a non-empty list")
+    if len(ids) > BATCH_MAX_ROWS_PER_OPERATION:
+        raise BatchError(f"at most {BATCH_MAX_ROWS_PER_OPERATION} ids per operation")
+    try:
+        return sorted({int(expense_id) for expense_id in ids})
+    except (TypeError, ValueError):
+        raise BatchError("'ids' must be integers")
+
+
+def _batch_text(field, value, nullable=False):
+    """A string column value from a batch operation, checked before it reaches the database"""
+    if value is None and nullable:
+        return None
+    if not isinstance(value, str):
+        raise BatchError(f"'{field}' must be a string")
+    max_length = Expense.__table__.c[field].type.length
+    if len(value) > max_length:
+        raise BatchError(f"'{field}' must be at most {max_length} characters")
+    return value
+
+
+def _batch_create_values(user_id, data, created_at, version):
+    """Column values for a new expense, following the same rules as add_expense"""
+    if not isinstance(data, dict):
+        raise BatchError('each expense must be an object')
+    try:
+        category = _batch_text('category', data['category'])
+        values = {
+            'user_id': user_id,
+            'date': parse_date(data['date']),
+            'category': category,
+            'subcategory': _batch_text('subcategory', data.get('subcategory'), nullable=True),
+            'description': _batch_text('description', data['description']),
+            'amount': float(data['amount']),
+            'is_recurring': bool(data.get('is_recurring', False)),
+            'is_active': True if category == 'Subscription' else bool(data.get('is_active', True)),
+            'is_bill': bool(data.get('is_bill', False)) if category == 'Subscription' else False,
+            'created_at': created_at,
+            'updated_at': created_at,
+            'version': version
+        }
+    except KeyError as e:
+        raise BatchError(f'missing field {e}')
+    except BatchError:
+        raise
+    except (TypeError, ValueError) as e:
+        raise BatchError(f'invalid expense: {e}')
+    return values
+
+
+def _batch_update_values(changes):
+    """SET clause for a bulk update, keeping is_bill only on subscriptions like update_expense"""
+    if not isinstance(changes, dict) or not changes:
+        raise BatchError("'set' must be a non-empty object")
+    unknown = set(changes) - BATCH_UPDATABLE_FIELDS
+    if unknown:
+        raise BatchError(f"cannot update: {', '.join(sorted(unknown))}")
+    
+    values = {}
+    for field, value in changes.items():
+        if field in ('is_recurring', 'is_active', 'is_bill'):
+            values[field] = bool(value)
+        elif field == 'subcategory':
+            values[field] = _batch_text(field, value, nullable=True)
+        elif field in ('category', 'description'):
+            if not _batch_text(field, value):
+                raise BatchError(f"'{field}' cannot be empty")
+            values[field] = value
+        elif field == 'date':
+            try:
+                values['date'] = parse_date(value)
+            except (TypeError, ValueError):
+                raise BatchError("'date' must be in YYYY-MM-DD format")
+        else:
+            try:
+                values['amount'] = float(value)
+            except (TypeError, ValueError):
+                raise BatchError("'amount' must be a number")
+    
+    if 'category' in values:
+        if values['category'] != 'Subscription':
+            values['is_bill'] = False
+        elif 'is_bill' not in values:
+            values['is_bill'] = Expense.is_bill
+    elif 'is_bill' in values:
+        values['is_bill'] = db.case((Expense.category == 'Subscription', values['is_bill']), else_=False)
+    return values
+
+
+@app.route('/api/expenses/batch', methods=['POST'])
 @login_required
-def export_csv():
+def batch_expenses():
+    """
+    Apply several create/update/delete/cancel operations in one transaction.
+
+    Body: {"operations": [
+        {"op": "create", "expenses": [{...expense fields...}, ...]},
+        {"op": "update", "ids": [1, 2], "set": {"category": "Groceries"}},
+        {"op": "delete", "ids": [3, 4]},
+        {"op": "cancel", "ids": [5]}
+    ]}
+    Each operation runs as one set-based statement scoped to the current user,
+    and rollups are adjusted once per affected bucket at the end.
+    """
     user_id = get_current_user_id()
+    operations = (request.json or {}).get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': "'operations' must be a non-empty list"}), 400
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return jsonify({'error': f'At most {BATCH_MAX_OPERATIONS} operations per batch'}), 400
+    
+    created_at = datetime.utcnow()
+    rollup_deltas = {}
+    results = []
+    
+    try:
+        version = bump_data_version(user_id)
+        for index, operation in enumerate(operations):
+            try:
+                op = operation.get('op') if isinstance(operation, dict) else None
+                
+                if op == 'create':
+                    rows = operation.get('expenses')
+                    if not isinstance(rows, list) or not rows:
+                        raise BatchError("'expenses' must be a non-empty list")
+                    if len(rows) > BATCH_MAX_ROWS_PER_OPERATION:
+                        raise BatchError(f"at most {BATCH_MAX_ROWS_PER_OPERATION} expenses per operation")
+                    values = [_batch_create_values(user_id, row, created_at, version) for row in rows]
+                    created = db.session.scalars(db.insert(Expense).returning(Expense), values).all()
+                    for expense in created:
+                        add_rollup_delta(rollup_deltas, expense.date, expense.category, expense.is_bill, expense.amount, 1)
+                    results.append({'op': op, 'affected': len(created), 'expenses': [e.to_dict() for e in created]})
+                
+                elif op == 'update':
+                    ids = _batch_ids(operation)
+                    values = _batch_update_values(operation.get('set'))
+                    rollup_deltas_for_ids(user_id, ids, -1, rollup_deltas)
+                    affected = db.session.execute(
+                        db.update(Expense)
+                        .where(Expense.user_id == user_id, Expense.id.in_(ids))
+                        .values(**values, version=version)
+                        .execution_options(synchronize_session=False)
+                    ).rowcount
+                    rollup_deltas_for_ids(user_id, ids, 1, rollup_deltas)
+                    updated = Expense.query.filter(Expense.user_id == user_id, Expense.id.in_(ids)).populate_existing().all()
+                    results.append({'op': op, 'affected': affected, 'expenses': [e.to_dict() for e in updated]})
+                
+                elif op == 'delete':
+                    ids = _batch_ids(operation)
+                    deleted_ids = [row[0] for row in db.session.query(Expense.id).filter(
+                        Expense.user_id == user_id, Expense.id.in_(ids)
+                    )]
+                    rollup_deltas_for_ids(user_id, deleted_ids, -1, rollup_deltas)
+                    record_tombstones(user_id, deleted_ids, version)
+                    db.session.execute(
+                        db.delete(Expense)
+                        .where(Expense.user_id == user_id, Expense.id.in_(deleted_ids))
+                        .execution_options(synchronize_session=False)
+                    )
+                    results.append({'op': op, 'affected': len(deleted_ids), 'ids': deleted_ids})
+                
+                elif op == 'cancel':
+                    ids = _batch_ids(operation)
+                    # Only subscriptions can be cancelled; rollups ignore is_active
+                    affected = db.session.execute(
+                        db.update(Expense)
+                        .where(Expense.user_id == user_id, Expense.id.in_(ids), Expense.category == 'Subscription')
+                        .values(is_active=False, version=version)
+                        .execution_options(synchronize_session=False)
+                    ).rowcount
+                    cancelled = Expense.query.filter(
+                        Expense.user_id == user_id, Expense.id.in_(ids), Expense.category == 'Subscription'
+                    ).populate_existing().all()
+                    results.append({'op': op, 'affected': affected, 'expenses': [e.to_dict() for e in cancelled]})
+                
+                else:
+                    raise BatchError("'op' must be one of create, update, delete, cancel")
+            except BatchError as e:
+                db.session.rollback()
+                return jsonify({'error': str(e), 'operation': index}), 400
+        
+        apply_rollup_deltas(user_id, rollup_deltas)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        # Details stay in the server log; database errors carry the SQL and its parameters
+        print(f"❌ Batch for user {user_id} failed: {e}")
+        return jsonify({'error': 'Failed to apply batch'}), 500
+    
+    return jsonify({'results': results}), 200
+
+
+# Rows fetched per round trip when streaming exports
+EXPORT_BATCH_SIZE = 2000
+
+
+def apply_export_filters(query):
+    """
+    Apply the export filters from the request: year+month, or an inclusive from/to date range.
+    Raises ValueError with a message naming the bad parameter.
+    """
     month = request.args.get('month')
     year = request.args.get('year')
-    
-    expenses = Expense.query.filter_by(user_id=user_id)
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
     
     if month and year:
-        expenses = expenses.filter(Expense.date.like(f'{year}-{month}%'))
-    
-    expenses = expenses.order_by(Expense.date.desc(), Expense.created_at.desc()).all()
+        try:
+            query = filter_by_month(query, year, month)
+        except ValueError:
+            raise ValueError('Expected month=<1-12> and year=YYYY')
+    try:
+        if date_from:
+            query = query.filter(Expense.date >= parse_date(date_from))
+        if date_to:
+            query = query.filter(Expense.date <= parse_date(date_to))
+    except ValueError:
+        raise ValueError('from and to must be in YYYY-MM-DD format')
+    return query
+
+
+@app.route('/api/export/csv')
+@login_required
+def export_csv():
+    user_id = get_current_user_id()
     
-    output = io.StringIO()
-    writer = csv.writer(output)
+    # Select plain columns rather than ORM objects and stream them in batches
+    # (server-side cursor on PostgreSQL), so memory stays flat for any export size
+    expenses = db.session.query(
+        Expense.date, Expense.category, Expense.description, Expense.amount,
+        Expense.is_recurring, Expense.is_active, Expense.is_bill
+    ).filter(Expense.user_id == user_id)
     
-    # Write header
-    writer.writerow(['Date', 'Category', 'Description', 'Amount', 'Recurring', 'Active', 'Is Bill'])
+    try:
+        expenses = apply_export_filters(expenses)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Write data
-    for expense in expenses:
-        writer.writerow([expense.date, expense.category, expense.description, expense.amount, 'Yes' if expense.is_recurring else 'No', 'Yes' if expense.is_active else 'No', 'Yes' if expense.is_bill else 'No'])
+    expenses = expenses.order_by(Expense.date.desc(), Expense.created_at.desc()).yield_per(EXPORT_BATCH_SIZE)
     
-    output.seek(0)
+    def generate():
+        output = io.StringIO()
+        writer = csv.writer(output)
+        
+        def flush():
+            chunk = output.getvalue()
+            output.seek(0)
+            output.truncate()
+            return chunk
+        
+        # Header goes out before the query runs
+        writer.writerow(['Date', 'Category', 'Description', 'Amount', 'Recurring', 'Active', 'Is Bill'])
+        yield flush()
+        
+        for row_count, expense in enumerate(expenses, 1):
+            writer.writerow([expense.date.strftime('%Y-%m-%d'), expense.category, expense.description, expense.amount, 'Yes' if expense.is_recurring else 'No', 'Yes' if expense.is_active else 'No', 'Yes' if expense.is_bill else 'No'])
+            if row_count % EXPORT_BATCH_SIZE == 0:
+                yield flush()
+        
+        yield flush()
     
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
+    return Response(
+        stream_with_context(generate()),
         mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'expenses_{datetime.now().strftime("%Y%m%d")}.csv'
+        headers={'Content-Disposition': f'attachment; filename=expenses_{datetime.now().strftime("%Y%m%d")}.csv'}
     )
 
 
+# Rows per executemany batch for bulk imports
+IMPORT_BATCH_SIZE = 5000
+# Per-row errors returned in an import report; the total count is always returned
+IMPORT_MAX_REPORTED_ERRORS = 1000
+
+
+@app.route('/api/import', methods=['POST'])
+@login_required
+def import_expenses():
+    """
+    Bulk-import expenses from a CSV or .xlsx upload in the export layout.
+
+    Rows are validated in one streaming pass and inserted in batches inside a
+    single transaction. Invalid rows are skipped and reported; with strict=1
+    nothing is imported if any row is invalid.
+    """
+    user_id = get_current_user_id()
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'Upload a CSV or .xlsx file in the "file" field'}), 400
+    
+    strict = request.args.get('strict') in ('1', 'true', 'yes')
+    if upload.filename.lower().endswith('.xlsx'):
+        rows = iter_xlsx_rows(upload.stream)
+    else:
+        rows = iter_csv_rows(upload.stream)
+    
+    created_at = datetime.utcnow()
+    imported = 0
+    errors = []
+    error_count = 0
+    batch = []
+    rollup_deltas = {}
+    
+    try:
+        version = bump_data_version(user_id)
+        defer_search_indexing(user_id, version)
+        for row_number, columns, row in rows:
+            try:
+                values = parse_row(columns, row)
+            except ValueError as e:
+                error_count += 1
+                if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                    errors.append({'row': row_number, 'error': str(e)})
+                continue
+            
+            if strict and error_count:
+                continue
+            
+            values['user_id'] = user_id
+            values['created_at'] = created_at
+            values['updated_at'] = created_at
+            values['version'] = version
+            batch.append(values)
+            
+            add_rollup_delta(rollup_deltas, values['date'], values['category'], values['is_bill'], values['amount'], 1)
+            
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                db.session.execute(db.insert(Expense), batch)
+                imported += len(batch)
+                batch = []
+        
+        if strict and error_count:
+            db.session.rollback()
+            return jsonify({
+                'imported': 0,
+                'error_count': error_count,
+                'errors': errors
+            }), 422
+        
+        if batch:
+            db.session.execute(db.insert(Expense), batch)
+            imported += len(batch)
+        
+        if imported:
+            apply_rollup_deltas(user_id, rollup_deltas)
+            index_deferred_expenses(user_id, version)
+            db.session.commit()
+        else:
+            # Nothing to keep, including the version bump
+            db.session.rollback()
+    except ImportFormatError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        return jsonify({'error': f'Could not read CSV file: {e}'}), 400
+    
+    return jsonify({
+        'imported': imported,
+        'error_count': error_count,
+        'errors': errors
+    }), 201 if imported else 200
+
+
 @app.route('/api/budget-limits', methods=['GET'])
 @login_required
+@etag_by_data_version
 def get_budget_limits():
     month = request.args.get('month')  # Format: YYYY-MM
     if not month:
         return jsonify({'error': 'Month parameter required'}), 400
     
-    budget_limit = BudgetLimit.query.filter_by(month=month).first()
+    return jsonify(budget_limits_for_month(get_current_user_id(), month))
+
+
+# Budget limits used for months the user hasn't set
+DEFAULT_BUDGET_LIMITS = {
+    'fixed_bills_loans': 600,
+    'variable_spending': 800,
+    'investing_min': 1500,
+    'investing_max': 1800
+}
+
+
+def budget_limits_for_month(user_id, month):
+    """A user's budget limits for a month, or the defaults if none are saved"""
+    budget_limit = BudgetLimit.query.filter_by(user_id=user_id, month=month).first()
     if budget_limit:
-        return jsonify(budget_limit.to_dict())
-    else:
-        # Return defaults if no budget limit exists for this month
-        return jsonify({
-            'month': month,
-            'fixed_bills_loans': 600,
-            'variable_spending': 800,
-            'investing_min': 1500,
-            'investing_max': 1800
-        })
+        return budget_limit.to_dict()
+    return dict(DEFAULT_BUDGET_LIMITS, month=month)
 
 
 @app.route('/api/budget-limits', methods=['POST'])
@@ -457,6 +2241,7 @@ def save_budget_limits():
         )
         db.session.add(budget_limit)
     
+    bump_data_version(user_id)
     db.session.commit()
     return jsonify(budget_limit.to_dict()), 200
 
@@ -464,59 +2249,57 @@ def save_budget_limits():
 @app.route('/api/export/excel')
 @login_required
 def export_excel():
+    """
+    Export expenses as .xlsx. Accepts the same filters as the CSV export plus
+    sheets=month (one sheet per month) and summary=1 (per month/category totals).
+    """
     user_id = get_current_user_id()
-    month = request.args.get('month')
-    year = request.args.get('year')
+    sheet_per_month = request.args.get('sheets') == 'month'
+    include_summary = request.args.get('summary') in ('1', 'true', 'yes')
+    
+    try:
+        base_query = apply_export_filters(db.session.query().select_from(Expense).filter(Expense.user_id == user_id))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    expenses = Expense.query.filter_by(user_id=user_id)
+    year_col = db.extract('year', Expense.date)
+    month_col = db.extract('month', Expense.date)
+    
+    # Longest value per column comes from one aggregate query, so widths are
+    # known before the write-only sheet starts streaming rows
+    length_columns = (
+        db.func.max(db.func.length(Expense.category)),
+        db.func.max(db.func.length(Expense.description)),
+        db.func.max(db.func.length(db.cast(Expense.amount, db.String)))
+    )
+    value_lengths = {}
+    if sheet_per_month:
+        for row_year, row_month, category_len, description_len, amount_len in base_query.add_columns(
+            year_col, month_col, *length_columns
+        ).group_by(year_col, month_col):
+            value_lengths[f'{int(row_year)}-{int(row_month):02d}'] = [10, category_len, description_len, amount_len, 3, 3, 3]
+    else:
+        category_len, description_len, amount_len = base_query.add_columns(*length_columns).one()
+        value_lengths[None] = [10, category_len, description_len, amount_len, 3, 3, 3]
+    
+    summary_rows = None
+    if include_summary:
+        summary_rows = [
+            (f'{int(row_year)}-{int(row_month):02d}', category, float(total), count)
+            for row_year, row_month, category, total, count in base_query.add_columns(
+                year_col, month_col, Expense.category, db.func.sum(Expense.amount), db.func.count(Expense.id)
+            ).group_by(year_col, month_col, Expense.category).order_by(
+                year_col.desc(), month_col.desc(), db.func.sum(Expense.amount).desc()
+            )
+        ]
+    
+    rows = base_query.add_columns(
+        Expense.date, Expense.category, Expense.description, Expense.amount,
+        Expense.is_recurring, Expense.is_active, Expense.is_bill
+    ).order_by(Expense.date.desc(), Expense.created_at.desc()).yield_per(EXPORT_BATCH_SIZE)
     
-    if month and year:
-        expenses = expenses.filter(Expense.date.like(f'{year}-{month}%'))
-    
-    expenses = expenses.order_by(Expense.date.desc(), Expense.created_at.desc()).all()
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Expenses"
-    
-    # Header row
-    headers = ['Date', 'Category', 'Description', 'Amount', 'Recurring', 'Active', 'Is Bill']
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num)
-        cell.value = header
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    # Data rows
-    for row_num, expense in enumerate(expenses, 2):
-        ws.cell(row=row_num, column=1, value=expense.date)
-        ws.cell(row=row_num, column=2, value=expense.category)
-        ws.cell(row=row_num, column=3, value=expense.description)
-        ws.cell(row=row_num, column=4, value=expense.amount)
-        ws.cell(row=row_num, column=5, value='Yes' if expense.is_recurring else 'No')
-        ws.cell(row=row_num, column=6, value='Yes' if expense.is_active else 'No')
-        ws.cell(row=row_num, column=7, value='Yes' if expense.is_bill else 'No')
-    
-    # Auto-adjust column widths
-    for col in ws.columns:
-        max_length = 0
-        col_letter = col[0].column_letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[col_letter].width = adjusted_width
-    
-    # Save to bytes
     output = io.BytesIO()
-    wb.save(output)
+    write_expense_workbook(output, rows, value_lengths, summary_rows=summary_rows, sheet_per_month=sheet_per_month)
     output.seek(0)
     
     return send_file(
@@ -548,7 +2331,7 @@ def send_budget_email_api():
         if not recipient_email:
             return jsonify({'error': 'Email address required'}), 400
         
-        # Get expenses for the month
+        # Get totals for the month
         user_id = get_current_user_id()
         if not month:
             month = datetime.now().strftime('%Y-%m')
@@ -564,81 +2347,15 @@ def send_budget_email_api():
             month_num = now.month
             month = f'{year}-{month_num:02d}'
         
-        expenses = Expense.query.filter(
-            Expense.user_id == user_id,
-            Expense.date.like(f'{year}-{month_num:02d}%')
-        ).all()
-        
-        # Calculate totals
-        fixed_bills_loans_spent = sum(
-            exp.amount for exp in expenses 
-            if exp.category in ['Bills', 'Loans'] or (exp.category == 'Subscription' and exp.is_bill)
-        )
-        
-        # Variable spending: everything except Bills, Loans, Income, Investment, Payment, and Subscription bills
-        variable_spending_spent = sum(
-            exp.amount for exp in expenses
-            if exp.category not in ['Bills', 'Loans', 'Income', 'Investment', 'Payment'] 
-            and not (exp.category == 'Subscription' and exp.is_bill)
+        budget_data = monthly_budget_report(
+            year, month_num, budget_limits_for_month(user_id, f'{year}-{month_num:02d}'), user_id
         )
         
-        investment_total = sum(exp.amount for exp in expenses if exp.category == 'Investment')
-        income_total = sum(exp.amount for exp in expenses if exp.category == 'Income')
-        
-        # Get budget limits
-        budget_limit = BudgetLimit.query.filter_by(user_id=user_id, month=month).first()
-        if not budget_limit:
-            # Use defaults
-            fixed_bills_loans_limit = 600
-            variable_spending_limit = 800
-            investment_min = 1500
-            investment_max = 1800
-        else:
-            fixed_bills_loans_limit = budget_limit.fixed_bills_loans
-            variable_spending_limit = budget_limit.variable_spending
-            investment_min = budget_limit.investing_min
-            investment_max = budget_limit.investing_max
-        
-        # Calculate remaining buffer
-        remaining_buffer = income_total - (fixed_bills_loans_spent + variable_spending_spent + investment_total)
-        
-        # Get top categories
-        category_totals = {}
-        for exp in expenses:
-            if exp.category not in ['Income', 'Investment', 'Payment']:
-                category_totals[exp.category] = category_totals.get(exp.category, 0) + exp.amount
-        
-        top_categories = [
-            {'category': cat, 'total': total}
-            for cat, total in sorted(category_totals.items(), key=lambda x: x[1], reverse=True)[:5]
-        ]
-        
-        # Format month display
-        month_display = datetime(year, month_num, 1).strftime('%B %Y')
-        
-        # Prepare budget data
-        budget_data = {
-            'month': month_display,
-            'fixed_bills_loans_spent': fixed_bills_loans_spent,
-            'fixed_bills_loans_limit': fixed_bills_loans_limit,
-            'variable_spending_spent': variable_spending_spent,
-            'variable_spending_limit': variable_spending_limit,
-            'investment_total': investment_total,
-            'investment_min': investment_min,
-            'investment_max': investment_max,
-            'income_total': income_total,
-            'remaining_buffer': remaining_buffer,
-            'top_categories': top_categories
-        }
-        
-        # Send email
-        try:
-            send_budget_email(recipient_email, budget_data)
-        except Exception as email_error:
-            print(f"Email sending error: {email_error}")
-            return jsonify({'error': f'Failed to send email: {str(email_error)}'}), 500
+        # Delivery happens in email_worker.py, so a slow provider never blocks this request
+        job = enqueue_email('budget_report', recipient_email, {'budget_data': budget_data}, user_id)
+        db.session.commit()
         
-        return jsonify({'success': True, 'message': 'Budget report sent successfully!'})
+        return jsonify({'success': True, 'message': 'Budget report queued for delivery!', 'id': job.id}), 202
         
     except ValueError as e:
         print(f"ValueError in send_budget_email_api: {e}")
@@ -661,9 +2378,10 @@ def send_test_email_api():
         if not recipient_email:
             return jsonify({'error': 'Email address required'}), 400
         
-        send_test_email(recipient_email)
+        job = enqueue_email('test', recipient_email, user_id=get_current_user_id())
+        db.session.commit()
         
-        return jsonify({'success': True, 'message': 'Test email sent successfully!'})
+        return jsonify({'success': True, 'message': 'Test email queued for delivery!', 'id': job.id}), 202
         
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
@@ -717,6 +2435,7 @@ def update_email_preferences():
         
         user.email_notifications_enabled = email_notifications_enabled
         user.notification_email = notification_email
+        bump_data_version(user_id)
         db.session.commit()
         
         return jsonify({
@@ -838,10 +2557,164 @@ def migrate_database():
         traceback.print_exc()
 
 
+# Columns added after the first release, as (table, column, DDL type and default).
+# Unlike migrate_database() this goes through the inspector, so it works on PostgreSQL too.
+ADDED_COLUMNS = [
+    ('user', 'data_version', 'INTEGER NOT NULL DEFAULT 0'),
+    ('expense', 'updated_at', 'TIMESTAMP'),
+    ('expense', 'version', 'INTEGER NOT NULL DEFAULT 0'),
+    ('user', 'tombstone_floor', 'INTEGER NOT NULL DEFAULT 0'),
+]
+# Indexes on ADDED_COLUMNS, which create_all() only builds for new tables
+ADDED_INDEXES = [
+    ('ix_expense_user_version', 'expense', 'user_id, version'),
+]
+
+
+def migrate_added_columns():
+    """Add any ADDED_COLUMNS and ADDED_INDEXES missing from existing tables"""
+    try:
+        inspector = db.inspect(db.engine)
+        with db.engine.begin() as conn:
+            for table, column, ddl in ADDED_COLUMNS:
+                if not inspector.has_table(table):
+                    continue
+                existing = [col['name'] for col in inspector.get_columns(table)]
+                if column not in existing:
+                    conn.execute(db.text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+                    print(f"✓ Added {column} column to {table} table")
+            for name, table, columns in ADDED_INDEXES:
+                conn.execute(db.text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({columns})'))
+    except Exception as e:
+        print(f"Added columns migration: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+def parse_legacy_date(value):
+    """Parse a date stored as text: '-' or '/' separated, zero padding optional, any time suffix ignored"""
+    day = re.split(r'[ T]', value.strip().replace('/', '-'), maxsplit=1)[0]
+    return datetime.strptime(day, '%Y-%m-%d').date()
+
+
+def normalise_expense_dates(conn, rows):
+    """
+    Rewrite (id, date text) rows as YYYY-MM-DD and report the ones that could
+    not be parsed, which are left as they are. Returns the number of skipped rows.
+    """
+    updates, skipped = [], []
+    for expense_id, value in rows:
+        try:
+            normalised = parse_legacy_date(value).isoformat()
+        except (TypeError, ValueError):
+            skipped.append((expense_id, value))
+            continue
+        if normalised != value:
+            updates.append({'id': expense_id, 'date': normalised})
+    if updates:
+        conn.execute(db.text('UPDATE expense SET date = :date WHERE id = :id'), updates)
+        print(f"✓ Normalised {len(updates)} expense dates to YYYY-MM-DD")
+    if skipped:
+        shown = ', '.join(f'{expense_id}: {value!r}' for expense_id, value in skipped[:20])
+        more = f' and {len(skipped) - 20} more' if len(skipped) > 20 else ''
+        print(f"⚠️  Skipped {len(skipped)} expense dates that are not a YYYY-MM-DD date (id: value): {shown}{more}")
+    return len(skipped)
+
+
+def migrate_expense_dates():
+    """Convert legacy string expense dates to a real DATE column and add the (user_id, date, ...) index"""
+    try:
+        with db.engine.begin() as conn:
+            if db.engine.dialect.name == 'postgresql':
+                result = conn.execute(db.text(
+                    "SELECT data_type FROM information_schema.columns "
+                    "WHERE table_name = 'expense' AND column_name = 'date'"
+                ))
+                row = result.fetchone()
+                if row and row[0] != 'date':
+                    skipped = normalise_expense_dates(conn, conn.execute(db.text('SELECT id, date FROM expense')).all())
+                    if skipped:
+                        print("⚠️  expense.date stays text until the skipped dates are fixed")
+                    else:
+                        conn.execute(db.text('ALTER TABLE expense ALTER COLUMN date TYPE DATE USING CAST(date AS DATE)'))
+                        print("✓ Converted expense.date to DATE")
+            else:
+                # SQLite stores DATE values as ISO strings, so existing rows only
+                # need normalising to the exact YYYY-MM-DD form SQLAlchemy parses
+                normalise_expense_dates(conn, conn.execute(db.text(
+                    'SELECT id, date FROM expense WHERE date(date) IS NULL OR date(date) != date'
+                )).all())
+            
+            conn.execute(db.text(
+                'CREATE INDEX IF NOT EXISTS ix_expense_user_date_created ON expense (user_id, date, created_at, id)'
+            ))
+            # The wider index above covers every query the old one served
+            conn.execute(db.text('DROP INDEX IF EXISTS ix_expense_user_date'))
+            print("✓ Expense date index ready")
+    except Exception as e:
+        print(f"Expense date migration: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+def migrate_expense_indexes():
+    """
+    Create Expense indexes added after the table, which create_all() skips for
+    existing tables, and rebuild any whose columns have changed since
+    """
+    try:
+        with db.engine.begin() as conn:
+            existing = {index['name']: index['column_names'] for index in db.inspect(conn).get_indexes('expense')}
+            for index in Expense.__table__.indexes:
+                columns = [column.name for column in index.columns]
+                if existing.get(index.name) == columns:
+                    continue
+                if index.name in existing:
+                    index.drop(conn)
+                index.create(conn)
+        print("✓ Expense query indexes ready")
+    except Exception as e:
+        print(f"Expense index migration: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+def migrate_expense_search():
+    """Create the search index on databases whose expense table predates it"""
+    try:
+        statements = EXPENSE_SEARCH_DDL.get(db.engine.dialect.name, [])
+        with db.engine.begin() as conn:
+            existed = db.inspect(conn).has_table('expense_fts') if db.engine.dialect.name == 'sqlite' else True
+            if db.engine.dialect.name == 'sqlite':
+                insert_trigger = conn.execute(db.text(
+                    "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'expense_fts_insert'"
+                )).scalar()
+                if insert_trigger and 'expense_fts_deferred' not in insert_trigger:
+                    # Predates imports deferring their rows; recreated below
+                    conn.execute(db.text('DROP TRIGGER expense_fts_insert'))
+            for statement in statements:
+                conn.execute(db.text(statement))
+            if not existed:
+                # Index the rows written before the triggers existed
+                conn.execute(db.text("INSERT INTO expense_fts (expense_fts) VALUES ('rebuild')"))
+        print("✓ Expense search index ready")
+    except Exception as e:
+        print(f"Expense search migration: {e}")
+        import traceback
+        traceback.print_exc()
+
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
         migrate_database()
+        migrate_added_columns()
+        migrate_expense_dates()
+        migrate_expense_indexes()
+        migrate_expense_search()
+        # Backfill rollups for databases created before the rollup table existed
+        if not MonthlyRollup.query.first() and Expense.query.first():
+            print(f"✓ Built {rebuild_monthly_rollups()} monthly rollup buckets")
     # Only run in debug mode if explicitly set in environment
     debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     app.run(debug=debug_mode, host='127.0.0.1', port=5000)
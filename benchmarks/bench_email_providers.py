@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Benchmark and check: SendGrid/Mailgun provider clients against a local stand-in.
+
+Runs a threaded HTTP server that accepts SendGrid v3 mail/send and Mailgun
+messages requests (with a configurable delay to stand in for network latency),
+then compares:
+  bare-post      requests.post per message, no Session (the old send_via_sendgrid)
+  client         SendGridClient, one distinct message per request over pooled connections
+  client xN      the same from N threads
+  batched        identical messages, grouped into 1000-recipient requests
+and checks that every recipient arrived exactly once, that Mailgun batches
+carry recipient-variables, and that a 429 with Retry-After is waited out.
+
+Usage:
+    python benchmarks/bench_email_providers.py
+    python benchmarks/bench_email_providers.py --messages 2000 --latency-ms 50
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_providers import EmailMessage, MailgunClient, SendGridClient  # noqa: E402
+
+
+class StandIn:
+    """What the stand-in server received"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.recipients = []
+        self.requests = 0
+        self.rate_limit_next = 0
+        self.rate_limited_at = None
+        self.retried_after = None
+
+    def reset(self):
+        with self.lock:
+            self.recipients = []
+            self.requests = 0
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body go out in separate writes; without this, keep-alive
+        # connections hit Nagle + delayed-ACK stalls that real providers don't have
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, body=b'', headers=None):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(state.latency)
+            with state.lock:
+                if state.rate_limit_next:
+                    state.rate_limit_next -= 1
+                    state.rate_limited_at = time.monotonic()
+                    self._reply(429, b'{"errors":[{"message":"too many requests"}]}', {'Retry-After': '0.3'})
+                    return
+                if state.rate_limited_at is not None and state.retried_after is None:
+                    state.retried_after = time.monotonic() - state.rate_limited_at
+                state.requests += 1
+
+            if self.path == '/v3/mail/send':
+                data = json.loads(body)
+                recipients = [to['email'] for p in data['personalizations'] for to in p['to']]
+                status = 202
+            elif self.path.endswith('/messages'):
+                form = parse_qs(body.decode())
+                recipients = form['to']
+                if len(recipients) > 1 and 'recipient-variables' not in form:
+                    self._reply(400, b'batch without recipient-variables')
+                    return
+                status = 200
+            else:
+                self._reply(404)
+                return
+            with state.lock:
+                state.recipients.extend(recipients)
+            self._reply(status, b'{}', {'X-RateLimit-Remaining': '100'})
+
+    return Handler
+
+
+def messages(count, identical):
+    return [
+        EmailMessage(f'user{i}@example.com', 'Weekly Budget Report',
+                     '<p>report</p>' if identical else f'<p>report {i}</p>',
+                     'report' if identical else f'report {i}')
+        for i in range(count)
+    ]
+
+
+def run_bare_post(base_url, batch):
+    for message in batch:
+        response = requests.post(f'{base_url}/v3/mail/send', headers={'Authorization': 'Bearer key'}, json={
+            'personalizations': [{'to': [{'email': message.recipient}]}],
+            'from': {'email': 'reports@example.com'},
+            'subject': message.subject,
+            'content': [{'type': 'text/plain', 'value': message.text},
+                        {'type': 'text/html', 'value': message.html}]
+        })
+        response.raise_for_status()
+
+
+def run_client(client, batch, threads=1):
+    if threads == 1:
+        results = client.send_many('reports@example.com', batch)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            results = [result for chunk in executor.map(
+                lambda message: client.send_many('reports@example.com', [message]), batch
+            ) for result in chunk]
+    failed = [error for _, error in results if error is not None]
+    if failed:
+        raise failed[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    state = StandIn(args.latency_ms / 1000)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    expected = sorted(message.recipient for message in messages(args.messages, True))
+    ok = True
+
+    print(f"Sending {args.messages:,} emails to a local stand-in with {args.latency_ms:g}ms per request")
+    for label, run in (
+        ('bare-post', lambda: run_bare_post(base_url, messages(args.messages, False))),
+        ('client', lambda: run_client(SendGridClient('key', base_url), messages(args.messages, False))),
+        (f'client x{args.threads}', lambda: run_client(
+            SendGridClient('key', base_url, pool_size=args.threads), messages(args.messages, False), args.threads)),
+        ('batched', lambda: run_client(SendGridClient('key', base_url), messages(args.messages, True))),
+    ):
+        state.reset()
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        delivered_once = sorted(state.recipients) == expected
+        ok = ok and delivered_once
+        print(f"  {label:<12} {args.messages / elapsed:9.1f} msgs/s  {elapsed:6.2f}s  "
+              f"requests: {state.requests:,}  {'ok' if delivered_once else 'MISMATCH'}")
+
+    state.reset()
+    mailgun = MailgunClient('key', 'mg.example.com', base_url)
+    run_client(mailgun, messages(args.messages, True))
+    mailgun_ok = sorted(state.recipients) == expected
+    print(f"  mailgun batched: {state.requests} request(s) for {len(state.recipients):,} recipients "
+          f"{'ok' if mailgun_ok else 'MISMATCH'}")
+
+    state.reset()
+    state.rate_limit_next = 1
+    client = SendGridClient('key', base_url)
+    run_client(client, messages(1, False))
+    waited_ok = state.retried_after is not None and state.retried_after >= 0.3
+    print(f"  rate limit: retried {state.retried_after or 0:.2f}s after a 429 with Retry-After: 0.3 "
+          f"{'ok' if waited_ok else 'FAILED'}")
+    stats = client.stats.snapshot()
+    print(f"  stats: {stats['requests']} request(s), rate limited {stats['rate_limited']}, p50 {stats['p50_ms']:.1f}ms")
+
+    server.shutdown()
+    if not (ok and mailgun_ok and waited_ok):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
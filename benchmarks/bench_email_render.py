@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Benchmark and check: weekly report email rendering for a fan-out batch.
+
+Builds N varied budget reports and renders the HTML and text bodies with:
+  legacy     the old inline f-string generate_email_content (the baseline)
+  jinja      generate_email_content: the Jinja templates compiled once per
+             process and rendered per report, one footer timestamp per batch
+             (what the app runs)
+Each renderer runs the whole batch --passes times, interleaved, and the best
+pass is reported, which keeps noise from other processes out of the ratio.
+Also checks that the output matches legacy apart from whitespace, and that
+HTML in category names is escaped.
+
+Usage:
+    python benchmarks/bench_email_render.py
+    python benchmarks/bench_email_render.py --reports 20000
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_service import generate_email_content  # noqa: E402
+
+CATEGORIES = ['Groceries', 'Fast Food', 'Restaurant', 'Coffee', 'Transportation', 'Shopping', 'Entertainment']
+FOOTER = re.compile(r'Generated on [^<\n]*')
+BETWEEN_TAGS = re.compile(r'>\s+<')
+
+
+def reports(count, seed=42):
+    rng = random.Random(seed)
+    for i in range(count):
+        income = round(rng.uniform(3000, 8000), 2)
+        bills = round(rng.uniform(200, 900), 2)
+        variable = round(rng.uniform(100, 1200), 2)
+        investment = round(rng.uniform(0, 2500), 2)
+        yield {
+            'month': 'March 2025',
+            'fixed_bills_loans_spent': bills, 'fixed_bills_loans_limit': 600.0,
+            'variable_spending_spent': variable, 'variable_spending_limit': 800.0,
+            'investment_total': investment, 'investment_min': 1500.0, 'investment_max': 1800.0,
+            'income_total': income, 'remaining_buffer': income - bills - variable - investment,
+            'top_categories': [{'category': category, 'total': round(rng.uniform(10, 400), 2)}
+                               for category in rng.sample(CATEGORIES, rng.randint(0, 5))],
+        }
+
+
+def legacy_generate_email_content(budget_data):
+    """The pre-template implementation, kept here for comparison"""
+    bills_percent = (budget_data['fixed_bills_loans_spent'] / budget_data['fixed_bills_loans_limit'] * 100) if budget_data['fixed_bills_loans_limit'] > 0 else 0
+    variable_percent = (budget_data['variable_spending_spent'] / budget_data['variable_spending_limit'] * 100) if budget_data['variable_spending_limit'] > 0 else 0
+
+    bills_status = "✅" if bills_percent < 100 else "⚠️ EXCEEDED"
+    variable_status = "✅" if variable_percent < 100 else "⚠️ EXCEEDED"
+
+    investment_status = "✅"
+    if budget_data['investment_total'] < budget_data['investment_min']:
+        investment_status = "📉 Below Target"
+    elif budget_data['investment_total'] > budget_data['investment_max']:
+        investment_status = "📈 Above Max"
+
+    buffer_status = "✅" if budget_data['remaining_buffer'] >= 0 else "⚠️ NEGATIVE"
+
+    subject = f'Weekly Budget Report - {budget_data.get("month", "Current Month")}'
+
+    html_content = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <style>
+            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
+            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
+            .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 10px 10px 0 0; }}
+            .content {{ background: #f9f9f9; padding: 20px; border-radius: 0 0 10px 10px; }}
+            .budget-item {{ background: white; padding: 15px; margin: 10px 0; border-radius: 8px; border-left: 4px solid #667eea; }}
+            .budget-item.exceeded {{ border-left-color: #ef4444; }}
+            .budget-item.warning {{ border-left-color: #f59e0b; }}
+            .progress-bar {{ background: #e5e7eb; height: 20px; border-radius: 10px; overflow: hidden; margin: 10px 0; }}
+            .progress-fill {{ height: 100%; background: #10b981; transition: width 0.3s; }}
+            .progress-fill.warning {{ background: #f59e0b; }}
+            .progress-fill.exceeded {{ background: #ef4444; }}
+            .amount {{ font-size: 24px; font-weight: bold; color: #667eea; }}
+            .category-list {{ list-style: none; padding: 0; }}
+            .category-list li {{ padding: 8px; background: white; margin: 5px 0; border-radius: 5px; }}
+            .footer {{ text-align: center; margin-top: 20px; color: #6b7280; font-size: 12px; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h1>💰 Weekly Budget Report</h1>
+                <p>{budget_data.get('month', 'Current Month')}</p>
+            </div>
+            <div class="content">
+                <h2>Budget Summary</h2>
+                
+                <!-- Fixed Bills + Loans -->
+                <div class="budget-item {'exceeded' if bills_percent >= 100 else 'warning' if bills_percent >= 80 else ''}">
+                    <h3>Fixed Bills + Loans {bills_status}</h3>
+                    <div class="amount">${budget_data['fixed_bills_loans_spent']:.2f} / ${budget_data['fixed_bills_loans_limit']:.2f}</div>
+                    <div class="progress-bar">
+                        <div class="progress-fill {'exceeded' if bills_percent >= 100 else 'warning' if bills_percent >= 80 else ''}" 
+                             style="width: {min(100, bills_percent)}%"></div>
+                    </div>
+                    <p>{bills_percent:.1f}% of budget used</p>
+                    <p>Remaining: ${budget_data['fixed_bills_loans_limit'] - budget_data['fixed_bills_loans_spent']:.2f}</p>
+                </div>
+                
+                <!-- Variable Spending -->
+                <div class="budget-item {'exceeded' if variable_percent >= 100 else 'warning' if variable_percent >= 80 else ''}">
+                    <h3>Variable Spending {variable_status}</h3>
+                    <div class="amount">${budget_data['variable_spending_spent']:.2f} / ${budget_data['variable_spending_limit']:.2f}</div>
+                    <div class="progress-bar">
+                        <div class="progress-fill {'exceeded' if variable_percent >= 100 else 'warning' if variable_percent >= 80 else ''}" 
+                             style="width: {min(100, variable_percent)}%"></div>
+                    </div>
+                    <p>{variable_percent:.1f}% of budget used</p>
+                    <p>Remaining: ${budget_data['variable_spending_limit'] - budget_data['variable_spending_spent']:.2f}</p>
+                </div>
+                
+                <!-- Investment -->
+                <div class="budget-item">
+                    <h3>Investment {investment_status}</h3>
+                    <div class="amount">${budget_data['investment_total']:.2f}</div>
+                    <p>Target Range: ${budget_data['investment_min']:.2f} - ${budget_data['investment_max']:.2f}</p>
+                </div>
+                
+                <!-- Remaining Buffer -->
+                <div class="budget-item {'exceeded' if budget_data['remaining_buffer'] < 0 else ''}">
+                    <h3>Remaining Buffer {buffer_status}</h3>
+                    <div class="amount" style="color: {'#ef4444' if budget_data['remaining_buffer'] < 0 else '#10b981'}">
+                        ${budget_data['remaining_buffer']:.2f}
+                    </div>
+                    <p>Income - (Bills/Loans + Variable Spending + Investment)</p>
+                </div>
+                
+                <!-- Top Categories -->
+                {f'''
+                <h3>Top Spending Categories</h3>
+                <ul class="category-list">
+                    {''.join([f'<li><strong>{cat["category"]}:</strong> ${cat["total"]:.2f}</li>' for cat in budget_data.get('top_categories', [])[:5]])}
+                </ul>
+                ''' if budget_data.get('top_categories') else ''}
+                
+                <div class="footer">
+                    <p>Generated on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
+                    <p>This is an automated weekly budget report from your Expense Tracker app.</p>
+                </div>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+
+    text_content = f"""
+    Weekly Budget Report - {budget_data.get('month', 'Current Month')}
+    
+    Fixed Bills + Loans: ${budget_data['fixed_bills_loans_spent']:.2f} / ${budget_data['fixed_bills_loans_limit']:.2f} ({bills_percent:.1f}%)
+    Variable Spending: ${budget_data['variable_spending_spent']:.2f} / ${budget_data['variable_spending_limit']:.2f} ({variable_percent:.1f}%)
+    Investment: ${budget_data['investment_total']:.2f} (Target: ${budget_data['investment_min']:.2f} - ${budget_data['investment_max']:.2f})
+    Remaining Buffer: ${budget_data['remaining_buffer']:.2f}
+    
+    Generated on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
+    """
+
+    return html_content, text_content, subject
+
+
+def normalized(content):
+    return ' '.join(BETWEEN_TAGS.sub('><', FOOTER.sub('Generated on', content)).split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reports', type=int, default=5000)
+    parser.add_argument('--passes', type=int, default=10)
+    args = parser.parse_args()
+
+    batch = list(reports(args.reports))
+    generated_at = datetime.now()
+    renderers = {
+        'legacy': legacy_generate_email_content,
+        'jinja': lambda budget_data: generate_email_content(budget_data, generated_at),
+    }
+
+    best = dict.fromkeys(renderers, float('inf'))
+    for _ in range(args.passes):
+        for label, run in renderers.items():
+            started = time.perf_counter()
+            for budget_data in batch:
+                run(budget_data)
+            best[label] = min(best[label], (time.perf_counter() - started) / args.reports * 1e6)
+
+    print(f"Rendering {args.reports:,} report emails (HTML + text), best of {args.passes} passes")
+    for label, per_message in best.items():
+        print(f"  {label:<8} {per_message:8.1f}us/msg  {1e6 / per_message:10,.0f} msgs/s  "
+              f"{best['legacy'] / per_message:5.2f}x legacy")
+
+    mismatches = sum(
+        tuple(map(normalized, legacy_generate_email_content(budget_data)))
+        != tuple(map(normalized, generate_email_content(budget_data)))
+        for budget_data in batch
+    )
+    print(f"  output matches legacy: {args.reports - mismatches:,}/{args.reports:,}")
+
+    html_content, _, _ = generate_email_content(dict(batch[0], top_categories=[{'category': '<b>x</b>', 'total': 1.0}]))
+    escaped = '&lt;b&gt;x&lt;/b&gt;' in html_content
+    print(f"  category names escaped: {'ok' if escaped else 'FAILED'}")
+    if mismatches or not escaped:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Excel export throughput and peak memory.
+
+Compares the previous export (materialised rows, regular in-memory Workbook,
+ws.cell() per value, second pass over every column for widths) against the
+write-only engine in excel_export.py. Each variant runs in its own
+subprocess so peak RSS is measured independently.
+
+Usage:
+    python benchmarks/bench_excel_export.py
+    python benchmarks/bench_excel_export.py --rows 500000
+"""
+
+import argparse
+import io
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CATEGORIES = ['Groceries', 'Fast Food', 'Restaurant', 'Coffee', 'Transportation',
+              'Shopping', 'Entertainment', 'Bills', 'Subscription', 'Income', 'Investment']
+
+
+def generate_rows(total_rows, seed=42):
+    """Yield export tuples newest-first, like the ORDER BY date DESC query"""
+    rng = random.Random(seed)
+    day = date(2024, 12, 31)
+    for i in range(total_rows):
+        if i % 40 == 0:
+            day -= timedelta(days=1)
+        yield (day, rng.choice(CATEGORIES), f'Expense {i} at some merchant',
+               round(rng.uniform(1, 300), 2), rng.random() < 0.1, True, rng.random() < 0.05)
+
+
+def run_legacy(total_rows):
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill, Alignment
+
+    expenses = list(generate_rows(total_rows))  # .all() in the old route
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Expenses"
+    headers = ['Date', 'Category', 'Description', 'Amount', 'Recurring', 'Active', 'Is Bill']
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF")
+    for col_num, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col_num)
+        cell.value = header
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = Alignment(horizontal='center', vertical='center')
+    for row_num, (expense_date, category, description, amount, is_recurring, is_active, is_bill) in enumerate(expenses, 2):
+        ws.cell(row=row_num, column=1, value=expense_date.strftime('%Y-%m-%d'))
+        ws.cell(row=row_num, column=2, value=category)
+        ws.cell(row=row_num, column=3, value=description)
+        ws.cell(row=row_num, column=4, value=amount)
+        ws.cell(row=row_num, column=5, value='Yes' if is_recurring else 'No')
+        ws.cell(row=row_num, column=6, value='Yes' if is_active else 'No')
+        ws.cell(row=row_num, column=7, value='Yes' if is_bill else 'No')
+    for col in ws.columns:
+        max_length = 0
+        col_letter = col[0].column_letter
+        for cell in col:
+            if len(str(cell.value)) > max_length:
+                max_length = len(str(cell.value))
+        ws.column_dimensions[col_letter].width = min(max_length + 2, 50)
+    output = io.BytesIO()
+    wb.save(output)
+    return output.tell()
+
+
+def run_engine(total_rows, sheet_per_month=False):
+    from excel_export import write_expense_workbook
+
+    # In the app these lengths come from one MAX(LENGTH(...)) aggregate query
+    lengths = [10, 14, 40, 6, 3, 3, 3]
+    if sheet_per_month:
+        value_lengths = {f'{y}-{m:02d}': lengths for y in range(2015, 2025) for m in range(1, 13)}
+    else:
+        value_lengths = {None: lengths}
+    output = io.BytesIO()
+    write_expense_workbook(output, generate_rows(total_rows), value_lengths, sheet_per_month=sheet_per_month)
+    return output.tell()
+
+
+def child(mode, total_rows):
+    started = time.perf_counter()
+    if mode == 'legacy':
+        size = run_legacy(total_rows)
+    elif mode == 'engine':
+        size = run_engine(total_rows)
+    else:
+        size = run_engine(total_rows, sheet_per_month=True)
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f'{elapsed} {peak_kb} {size}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--child', choices=['legacy', 'engine', 'engine-monthly'])
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.rows)
+        return
+
+    print(f"Exporting {args.rows:,} rows")
+    for mode in ('legacy', 'engine', 'engine-monthly'):
+        result = subprocess.run(
+            [sys.executable, __file__, '--child', mode, '--rows', str(args.rows)],
+            capture_output=True, text=True, check=True
+        )
+        elapsed, peak_kb, size = result.stdout.split()
+        elapsed = float(elapsed)
+        print(f"  {mode:<15} {args.rows / elapsed:>10,.0f} rows/s  "
+              f"{elapsed:6.2f}s  peak RSS {int(peak_kb) / 1024:7.1f} MB  file {int(size) / 1024 / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
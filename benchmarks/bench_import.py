@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bulk CSV import through POST /api/import.
+
+Generates a CSV in the export layout and uploads it to the app with Flask's
+test client against a fresh SQLite database, reporting rows/sec. Then adds
+expenses one at a time through POST /api/expenses on top of the imported
+rows, since every index and search trigger on expense is paid on both paths.
+
+Usage:
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --rows 20000 --inserts 500
+"""
+
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_import.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db, User, Expense, verify_monthly_rollups  # noqa: E402
+
+CATEGORIES = ['Groceries', 'Fast Food', 'Restaurant', 'Coffee', 'Transportation',
+              'Shopping', 'Entertainment', 'Bills', 'Subscription', 'Income', 'Investment']
+
+
+def build_csv(total_rows, seed=42):
+    rng = random.Random(seed)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['Date', 'Category', 'Description', 'Amount', 'Recurring', 'Active', 'Is Bill'])
+    start = date(2015, 1, 1)
+    for i in range(total_rows):
+        day = start + timedelta(days=rng.randrange(3650))
+        writer.writerow([day.isoformat(), rng.choice(CATEGORIES), f'Bank transaction {i}',
+                         round(rng.uniform(1, 300), 2), 'No', 'Yes', 'No'])
+    return output.getvalue().encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--inserts', type=int, default=1000)
+    args = parser.parse_args()
+
+    payload = build_csv(args.rows)
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+    started = time.perf_counter()
+    response = client.post(
+        '/api/import',
+        data={'file': (io.BytesIO(payload), 'bank_export.csv')},
+        content_type='multipart/form-data'
+    )
+    elapsed = time.perf_counter() - started
+    result = response.get_json()
+
+    with app.app_context():
+        stored = Expense.query.filter_by(user_id=user_id).count()
+        drift = verify_monthly_rollups(user_id)
+
+    print(f"Imported {result['imported']:,} rows ({len(payload) / 1024 / 1024:.1f} MB CSV) "
+          f"in {elapsed:.2f}s -> {result['imported'] / elapsed:,.0f} rows/s")
+    print(f"Rows in table: {stored:,}  errors: {result['error_count']}  rollup drift: {len(drift)}")
+
+    started = time.perf_counter()
+    for i in range(args.inserts):
+        response = client.post('/api/expenses', json={
+            'date': '2024-03-05', 'category': 'Groceries', 'description': f'Single insert {i}', 'amount': 12.5
+        })
+        assert response.status_code == 201, response.get_data(as_text=True)
+    elapsed = time.perf_counter() - started
+    if args.inserts:
+        print(f"Added {args.inserts:,} expenses one at a time in {elapsed:.2f}s -> "
+              f"{elapsed / args.inserts * 1000:.2f}ms each")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /api/expenses/all serialization throughput and peak memory.
+
+Loads N expenses for one user, then serves the full list three ways and
+checks they produce the same JSON:
+  orm-jsonify    Expense ORM objects, to_dict() per row, one jsonify() (the old path)
+  rows-json      Core rows of the needed columns streamed in batches, json module
+  rows-orjson    the same through orjson (what the app runs when orjson is installed)
+Peak memory is the tracemalloc high-water mark while one response is built
+and read to the end, chunk by chunk, the way a WSGI server sends it.
+
+Usage:
+    python benchmarks/bench_json_read.py
+    python benchmarks/bench_json_read.py --rows 500000
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_json_read.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify  # noqa: E402
+
+import app as app_module  # noqa: E402
+from app import app, db, User, Expense  # noqa: E402
+
+CATEGORIES = ['Groceries', 'Fast Food', 'Restaurant', 'Coffee', 'Transportation', 'Shopping',
+              'Entertainment', 'Bills', 'Subscription', 'Income', 'Investment']
+
+
+def load(total_rows, user_id, batch_size=20000, seed=42):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    start = date(2015, 1, 1)
+    batch = []
+    for i in range(total_rows):
+        batch.append({
+            'user_id': user_id, 'date': start + timedelta(days=rng.randrange(3650)),
+            'category': rng.choice(CATEGORIES), 'subcategory': 'Veggies' if rng.random() < 0.2 else None,
+            'description': f'Expense {i}', 'amount': round(rng.uniform(1, 300), 2),
+            'is_recurring': False, 'is_active': True, 'is_bill': rng.random() < 0.1,
+            'created_at': now - timedelta(seconds=i),
+        })
+        if len(batch) >= batch_size:
+            db.session.execute(db.insert(Expense), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(Expense), batch)
+    db.session.commit()
+
+
+def orm_jsonify(user_id):
+    expenses = Expense.query.filter_by(user_id=user_id).order_by(Expense.date.asc()).all()
+    return jsonify([expense.to_dict() for expense in expenses])
+
+
+def rows_streamed(user_id):
+    return app_module.stream_expense_rows(
+        db.select(*app_module.EXPENSE_READ_COLUMNS).where(Expense.user_id == user_id).order_by(Expense.date.asc())
+    )
+
+
+def serve(build, user_id, keep_body=False):
+    """Build the response and read its body to the end, like a WSGI server; returns (size, body or None)"""
+    with app.test_request_context('/api/expenses/all'):
+        response = build(user_id)
+        size = 0
+        body = [] if keep_body else None
+        for chunk in response.response:
+            chunk = chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+            size += len(chunk)
+            if keep_body:
+                body.append(chunk)
+        response.close()
+        db.session.remove()
+    return size, b''.join(body) if keep_body else None
+
+
+def measure(build, user_id, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        serve(build, user_id)
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    size, _ = serve(build, user_id)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    _, body = serve(build, user_id, keep_body=True)
+    return statistics.median(timings), peak, size, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        load(args.rows, user_id)
+
+    orjson = app_module.orjson
+    print(f"Serving {args.rows:,} expenses (orjson {'installed' if orjson else 'NOT installed'})")
+    reference = None
+    ok = True
+    for label, build, encoder in (
+        ('orm-jsonify', orm_jsonify, None),
+        ('rows-json', rows_streamed, None),
+        ('rows-orjson', rows_streamed, orjson),
+    ):
+        if label == 'rows-orjson' and orjson is None:
+            continue
+        # Streamed responses serialize while they are read, so switch the encoder around the whole run
+        app_module.orjson = encoder
+        elapsed, peak, size, body = measure(build, user_id, args.repeat)
+        app_module.orjson = orjson
+        decoded = json.loads(body)
+        if reference is None:
+            reference = decoded
+        same = decoded == reference
+        ok = ok and same
+        print(f"  {label:<12} {args.rows / elapsed:11,.0f} rows/s  {elapsed * 1000:8.1f}ms  "
+              f"peak {peak / 1024 / 1024:7.1f} MiB  body {size / 1024 / 1024:5.1f} MiB  "
+              f"{'ok' if same else 'MISMATCH'}")
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark: budget report computation for one heavy month.
+
+Loads N expenses into a single month for one user, then builds the report's
+budget_data four ways and checks they agree:
+  legacy        five Python passes over ORM rows plus sorted() (the old copy-pasted code)
+  python-pass   one pass over plain (category, is_bill, amount) tuples
+  sql-expense   one conditional-aggregation GROUP BY over the expense table
+  sql-rollup    the same query over the monthly rollup table (what the app runs)
+
+Usage:
+    python benchmarks/bench_reports.py
+    python benchmarks/bench_reports.py --rows 500000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_reports.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import (  # noqa: E402
+    app, db, User, Expense, DEFAULT_BUDGET_LIMITS, monthly_budget_report, rebuild_monthly_rollups,
+)
+from reports import build_budget_data, category_totals_from_rows, category_totals_statement  # noqa: E402
+
+CATEGORIES = ['Groceries', 'Fast Food', 'Restaurant', 'Coffee', 'Transportation', 'Shopping',
+              'Entertainment', 'Bills', 'Loans', 'Subscription', 'Income', 'Investment', 'Payment']
+YEAR, MONTH = 2025, 3
+
+
+def load(total_rows, user_id, batch_size=20000, seed=42):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    batch = []
+    for i in range(total_rows):
+        category = rng.choice(CATEGORIES)
+        batch.append({
+            'user_id': user_id, 'date': date(YEAR, MONTH, rng.randint(1, 31)), 'category': category,
+            'description': f'Expense {i}', 'amount': round(rng.uniform(1, 300), 2),
+            'is_recurring': False, 'is_active': True,
+            'is_bill': category == 'Subscription' and rng.random() < 0.5, 'created_at': now,
+        })
+        if len(batch) >= batch_size:
+            db.session.execute(db.insert(Expense), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(Expense), batch)
+    db.session.commit()
+    rebuild_monthly_rollups(user_id)
+
+
+def month_range():
+    return date(YEAR, MONTH, 1), date(YEAR, MONTH + 1, 1)
+
+
+def run_legacy(user_id):
+    start, end = month_range()
+    expenses = Expense.query.filter(Expense.user_id == user_id, Expense.date >= start, Expense.date < end).all()
+    fixed = sum(e.amount for e in expenses
+                if e.category in ['Bills', 'Loans'] or (e.category == 'Subscription' and e.is_bill))
+    variable = sum(e.amount for e in expenses
+                   if e.category not in ['Bills', 'Loans', 'Income', 'Investment', 'Payment']
+                   and not (e.category == 'Subscription' and e.is_bill))
+    investment = sum(e.amount for e in expenses if e.category == 'Investment')
+    income = sum(e.amount for e in expenses if e.category == 'Income')
+    category_totals = {}
+    for e in expenses:
+        if e.category not in ['Income', 'Investment', 'Payment']:
+            category_totals[e.category] = category_totals.get(e.category, 0) + e.amount
+    top = sorted(category_totals.items(), key=lambda x: x[1], reverse=True)[:5]
+    return fixed, variable, investment, income, [category for category, _ in top]
+
+
+def run_python_pass(user_id):
+    start, end = month_range()
+    rows = db.session.query(Expense.category, Expense.is_bill, Expense.amount).filter(
+        Expense.user_id == user_id, Expense.date >= start, Expense.date < end
+    )
+    return build_budget_data('March 2025', category_totals_from_rows(rows), DEFAULT_BUDGET_LIMITS)
+
+
+def run_sql_expense(user_id):
+    start, end = month_range()
+    statement = category_totals_statement(Expense.category, Expense.is_bill, Expense.amount).where(
+        Expense.user_id == user_id, Expense.date >= start, Expense.date < end
+    )
+    return build_budget_data('March 2025', db.session.execute(statement).all(), DEFAULT_BUDGET_LIMITS)
+
+
+def run_sql_rollup(user_id):
+    return monthly_budget_report(YEAR, MONTH, DEFAULT_BUDGET_LIMITS, user_id)
+
+
+def summary(budget_data):
+    return (budget_data['fixed_bills_loans_spent'], budget_data['variable_spending_spent'],
+            budget_data['investment_total'], budget_data['income_total'],
+            [entry['category'] for entry in budget_data['top_categories']])
+
+
+def same(a, b):
+    return all(abs(x - y) < 0.01 for x, y in zip(a[:4], b[:4])) and a[4] == b[4]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        started = time.perf_counter()
+        load(args.rows, user_id)
+        print(f"Loaded {args.rows:,} expenses into {YEAR}-{MONTH:02d} in {time.perf_counter() - started:.1f}s")
+
+        expected = None
+        for label, run in (('legacy', run_legacy), ('python-pass', lambda uid: summary(run_python_pass(uid))),
+                           ('sql-expense', lambda uid: summary(run_sql_expense(uid))),
+                           ('sql-rollup', lambda uid: summary(run_sql_rollup(uid)))):
+            timings = []
+            for _ in range(args.repeat):
+                db.session.expunge_all()
+                started = time.perf_counter()
+                result = run(user_id)
+                timings.append((time.perf_counter() - started) * 1000)
+            expected = expected or result
+            status = 'ok' if same(result, expected) else 'MISMATCH'
+            print(f"  {label:<12} median {statistics.median(timings):9.2f}ms  best {min(timings):9.2f}ms  [{status}]")
+
+
+if __name__ == '__main__':
+    main()
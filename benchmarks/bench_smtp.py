@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark: SMTP sends per second, one connection per message vs the pool.
+
+Starts a local aiosmtpd server with STARTTLS (self-signed certificate made
+with openssl) and AUTH, then sends the same report email:
+  per-message   connect + STARTTLS + login + send + quit for every message (the old send_via_smtp)
+  pooled        SMTPConnectionPool with one connection, reused across messages
+  pooled xN     SMTPConnectionPool shared by N sender threads
+
+Requires aiosmtpd (pip install aiosmtpd) and the openssl command.
+
+Usage:
+    python benchmarks/bench_smtp.py
+    python benchmarks/bench_smtp.py --messages 2000 --threads 8
+"""
+
+import argparse
+import os
+import smtplib
+import ssl
+import subprocess
+import sys
+import tempfile
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+# aiosmtpd logs a deprecation warning about its own internals on every AUTH
+logging.getLogger('mail.log').setLevel(logging.ERROR)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from email_service import SMTPConnectionPool, build_smtp_message  # noqa: E402
+
+SENDER = 'reports@example.com'
+PASSWORD = 'secret'
+BUDGET_DATA = {
+    'month': 'March 2025',
+    'fixed_bills_loans_spent': 450.0, 'fixed_bills_loans_limit': 600.0,
+    'variable_spending_spent': 650.0, 'variable_spending_limit': 800.0,
+    'investment_total': 1500.0, 'investment_min': 1500.0, 'investment_max': 1800.0,
+    'income_total': 5000.0, 'remaining_buffer': 1400.0,
+    'top_categories': [{'category': 'Groceries', 'total': 200.0}, {'category': 'Coffee', 'total': 50.0}],
+}
+
+
+class CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return '250 Message accepted'
+
+
+def make_certificate(directory):
+    cert = os.path.join(directory, 'cert.pem')
+    key = os.path.join(directory, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', key, '-out', cert,
+         '-days', '1', '-subj', '/CN=localhost'],
+        check=True, capture_output=True
+    )
+    return cert, key
+
+
+def start_server(port):
+    cert, key = make_certificate(tempfile.mkdtemp())
+    server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_context.load_cert_chain(cert, key)
+    handler = CountingHandler()
+    controller = Controller(
+        handler, hostname='127.0.0.1', port=port,
+        tls_context=server_context, require_starttls=True,
+        authenticator=lambda server, session, envelope, mechanism, auth_data: AuthResult(success=True),
+        auth_require_tls=True,
+    )
+    controller.start()
+    return controller, handler
+
+
+def client_context():
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def run_per_message(port, messages, context):
+    """Returns the number of connections opened: one per message"""
+    for i in range(messages):
+        msg = build_smtp_message(SENDER, f'user{i}@example.com', BUDGET_DATA)
+        with smtplib.SMTP('127.0.0.1', port) as server:
+            server.starttls(context=context)
+            server.login(SENDER, PASSWORD)
+            server.send_message(msg)
+    return messages
+
+
+def run_pooled(port, messages, context, threads):
+    pool = SMTPConnectionPool('127.0.0.1', port, SENDER, PASSWORD, ssl_context=context, max_size=threads)
+
+    def send(i):
+        pool.send_message(build_smtp_message(SENDER, f'user{i}@example.com', BUDGET_DATA))
+
+    if threads == 1:
+        for i in range(messages):
+            send(i)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(send, range(messages)))
+    pool.close()
+    return pool.connections_opened
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8025)
+    args = parser.parse_args()
+
+    controller, handler = start_server(args.port)
+    context = client_context()
+    try:
+        print(f"Sending {args.messages:,} report emails to a local STARTTLS + AUTH server")
+        for label, run in (
+            ('per-message', lambda: run_per_message(args.port, args.messages, context)),
+            ('pooled', lambda: run_pooled(args.port, args.messages, context, 1)),
+            (f'pooled x{args.threads}', lambda: run_pooled(args.port, args.messages, context, args.threads)),
+        ):
+            before = handler.received
+            started = time.perf_counter()
+            connections = run()
+            elapsed = time.perf_counter() - started
+            delivered = handler.received - before
+            print(f"  {label:<12} {delivered / elapsed:8.1f} msgs/s  {elapsed:6.2f}s  "
+                  f"connections opened: {connections:,}  delivered: {delivered:,}")
+    finally:
+        controller.stop()
+
+
+if __name__ == '__main__':
+    main()
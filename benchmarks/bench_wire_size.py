@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark: wire size of GET /api/expenses/all per response format and encoding.
+
+Loads N expenses of varied history for one user, then fetches the full list
+through the app as rows (one object per expense) and as ?format=columnar,
+each uncompressed, gzip and brotli, and checks the decoded columnar payload
+matches the rows. Prints bytes on the wire and server time per response.
+
+Usage:
+    python benchmarks/bench_wire_size.py
+    python benchmarks/bench_wire_size.py --rows 200000
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_wire_size.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+from app import app, db, User, Expense  # noqa: E402
+
+CATEGORIES = ['Groceries', 'Fast Food', 'Restaurant', 'Coffee', 'Transportation', 'Shopping',
+              'Entertainment', 'Healthcare', 'Bills', 'Loans', 'Subscription', 'Income', 'Investment']
+SUBCATEGORIES = ['Veggies', 'Meat', 'Snacks', 'Fuel', 'Clothes', 'Games']
+MERCHANTS = ['Starbucks', 'Tim Hortons', 'Walmart', 'Costco', 'Loblaws', 'Shell', 'Uber', 'Amazon',
+             'Netflix', 'Spotify', 'Cineplex', 'IKEA', 'Metro', 'Subway', 'Rogers', 'Hydro One']
+
+
+def load(total_rows, user_id, batch_size=20000, seed=42):
+    rng = random.Random(seed)
+    start = date(2015, 1, 1)
+    batch = []
+    for i in range(total_rows):
+        day = start + timedelta(days=rng.randrange(3650))
+        batch.append({
+            'user_id': user_id, 'date': day, 'category': rng.choice(CATEGORIES),
+            'subcategory': rng.choice(SUBCATEGORIES) if rng.random() < 0.3 else None,
+            'description': f'{rng.choice(MERCHANTS)} {rng.randrange(1000)}', 'amount': round(rng.uniform(1, 300), 2),
+            'is_recurring': rng.random() < 0.05, 'is_active': rng.random() < 0.95, 'is_bill': rng.random() < 0.1,
+            'created_at': datetime.combine(day, datetime.min.time()) + timedelta(seconds=rng.randrange(86400)),
+        })
+        if len(batch) >= batch_size:
+            db.session.execute(db.insert(Expense), batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(Expense), batch)
+    db.session.commit()
+
+
+def decode_columnar(data):
+    """The template's decodeColumnar()"""
+    columns, categories = data['columns'], data['categories']
+    return [{
+        'id': columns['id'][i], 'date': columns['date'][i], 'category': categories[columns['category'][i]],
+        'subcategory': columns['subcategory'][i], 'description': columns['description'][i],
+        'amount': columns['amount'][i], 'is_recurring': columns['is_recurring'][i] == 1,
+        'is_active': columns['is_active'][i] == 1, 'is_bill': columns['is_bill'][i] == 1,
+        'created_at': columns['created_at'][i],
+    } for i in range(data['count'])]
+
+
+def fetch(client, url, accept_encoding, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(url, headers={'Accept-Encoding': accept_encoding})
+        body = response.data
+        timings.append(time.perf_counter() - started)
+    encoding = response.headers.get('Content-Encoding')
+    if encoding == 'gzip':
+        raw = gzip.decompress(body)
+    elif encoding == 'br':
+        raw = app_module.brotli.decompress(body)
+    else:
+        raw = body
+    return len(body), encoding or 'identity', statistics.median(timings), json.loads(raw)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        user = User(username='bench', email='bench@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        load(args.rows, user_id)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+
+    encodings = ['identity', 'gzip'] + (['br'] if app_module.brotli is not None else [])
+    print(f"GET /api/expenses/all for {args.rows:,} expenses "
+          f"(brotli {'installed' if app_module.brotli is not None else 'NOT installed'})")
+    print(f"  {'format':<10} {'encoding':<9} {'bytes':>12} {'per row':>8} {'vs rows':>8} {'server':>9}")
+    baseline = None
+    reference = None
+    ok = True
+    for response_format in ('rows', 'columnar'):
+        url = '/api/expenses/all' + ('?format=columnar' if response_format == 'columnar' else '')
+        for accept_encoding in encodings:
+            size, encoding, elapsed, data = fetch(client, url, accept_encoding, args.repeat)
+            expenses = decode_columnar(data) if response_format == 'columnar' else data
+            if reference is None:
+                baseline, reference = size, expenses
+            same = expenses == reference and encoding == accept_encoding
+            ok = ok and same
+            print(f"  {response_format:<10} {encoding:<9} {size:12,} {size / args.rows:8.1f} "
+                  f"{baseline / size:7.1f}x {elapsed * 1000:7.0f}ms  {'ok' if same else 'MISMATCH'}")
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+HTTP clients for API-based email providers (SendGrid, Mailgun).
+Each client keeps a pooled keep-alive requests.Session, groups recipients of
+identical messages into the provider's batch format, waits out rate limits
+the provider announces, and records send latency.
+"""
+import json
+import threading
+import time
+from collections import deque, namedtuple
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# One email; messages with the same sender, subject and bodies can share a request
+EmailMessage = namedtuple('EmailMessage', ['recipient', 'subject', 'html', 'text'])
+
+# Seconds to wait for the connection / for the response
+REQUEST_TIMEOUT = (5, 30)
+# Retries for a request the provider rejected with 429 Too Many Requests
+MAX_RATE_LIMIT_RETRIES = 5
+# Longest single wait for a rate limit to reset
+MAX_RATE_LIMIT_WAIT = 60
+
+
+class ProviderError(ValueError):
+    """The provider rejected a request"""
+
+
+class SendStats:
+    """Thread-safe send latency statistics over the most recent requests"""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.requests = 0
+        self.messages = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def record(self, latency, messages, ok):
+        with self._lock:
+            self._latencies.append(latency)
+            self.requests += 1
+            if ok:
+                self.messages += messages
+            else:
+                self.errors += 1
+
+    def record_rate_limit(self):
+        with self._lock:
+            self.rate_limited += 1
+
+    def snapshot(self):
+        """Counters plus mean/p50/p95/max request latency in milliseconds"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                'requests': self.requests,
+                'messages': self.messages,
+                'errors': self.errors,
+                'rate_limited': self.rate_limited
+            }
+        if latencies:
+            stats.update({
+                'mean_ms': sum(latencies) / len(latencies) * 1000,
+                'p50_ms': latencies[len(latencies) // 2] * 1000,
+                'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+                'max_ms': latencies[-1] * 1000
+            })
+        return stats
+
+
+class ProviderClient:
+    """Shared session, rate-limit and stats handling; subclasses build the requests"""
+
+    name = None
+    max_batch = 1
+
+    def __init__(self, api_key, base_url, pool_size=10):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.stats = SendStats()
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+
+    def _wait_for_rate_limit(self):
+        with self._lock:
+            delay = self._blocked_until - time.time()
+        if delay > 0:
+            time.sleep(min(delay, MAX_RATE_LIMIT_WAIT))
+
+    def _note_rate_limit(self, response):
+        """Block further requests until the limit resets, per the response headers"""
+        delay = None
+        retry_after = response.headers.get('Retry-After')
+        reset = response.headers.get('X-RateLimit-Reset')
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        try:
+            if retry_after is not None:
+                delay = float(retry_after)
+            elif reset is not None and (response.status_code == 429 or remaining == '0'):
+                reset = float(reset)
+                # Providers send either an epoch timestamp or seconds from now
+                delay = reset - time.time() if reset > 1e9 else reset
+        except ValueError:
+            pass
+        if delay is None and response.status_code == 429:
+            delay = 1.0
+        if delay is not None and delay > 0:
+            with self._lock:
+                self._blocked_until = max(self._blocked_until, time.time() + min(delay, MAX_RATE_LIMIT_WAIT))
+
+    def _post(self, url, message_count, **kwargs):
+        for _ in range(MAX_RATE_LIMIT_RETRIES + 1):
+            self._wait_for_rate_limit()
+            started = time.perf_counter()
+            try:
+                response = self.session.post(url, timeout=REQUEST_TIMEOUT, **kwargs)
+            except requests.RequestException:
+                self.stats.record(time.perf_counter() - started, message_count, False)
+                raise
+            self._note_rate_limit(response)
+            if response.status_code == 429:
+                self.stats.record_rate_limit()
+                continue
+            ok = response.ok
+            self.stats.record(time.perf_counter() - started, message_count, ok)
+            if not ok:
+                raise ProviderError(f"{self.name} API error {response.status_code}: {response.text[:500]}")
+            return response
+        raise ProviderError(f"{self.name} API rate limit still exceeded after {MAX_RATE_LIMIT_RETRIES} retries")
+
+    def send_many(self, sender_email, messages):
+        """
+        Send messages, batching recipients of identical content into one request.
+
+        Returns:
+            List of (recipient, error) in input order; error is None on success
+        """
+        groups = {}
+        for index, message in enumerate(messages):
+            groups.setdefault((message.subject, message.html, message.text), []).append(index)
+
+        results = [None] * len(messages)
+        for indexes in groups.values():
+            for start in range(0, len(indexes), self.max_batch):
+                chunk = [messages[i] for i in indexes[start:start + self.max_batch]]
+                try:
+                    self._send_batch(sender_email, chunk)
+                    error = None
+                except Exception as e:
+                    error = e
+                for i in indexes[start:start + self.max_batch]:
+                    results[i] = (messages[i].recipient, error)
+        return results
+
+    def _send_batch(self, sender_email, messages):
+        raise NotImplementedError
+
+
+class SendGridClient(ProviderClient):
+    """SendGrid v3 mail/send: one personalization per recipient, up to 1000 per request"""
+
+    name = 'SendGrid'
+    max_batch = 1000
+
+    def __init__(self, api_key, base_url='https://api.sendgrid.com', pool_size=10):
+        super().__init__(api_key, base_url, pool_size)
+        self.session.headers['Authorization'] = f'Bearer {api_key}'
+
+    def _send_batch(self, sender_email, messages):
+        first = messages[0]
+        data = {
+            # Separate personalizations keep recipients from seeing each other
+            "personalizations": [{"to": [{"email": message.recipient}]} for message in messages],
+            "from": {"email": sender_email},
+            "subject": first.subject,
+            "content": [
+                {"type": "text/plain", "value": first.text},
+                {"type": "text/html", "value": first.html}
+            ]
+        }
+        self._post(f'{self.base_url}/v3/mail/send', len(messages), json=data)
+
+
+class MailgunClient(ProviderClient):
+    """Mailgun messages API: batch sending via recipient-variables, up to 1000 per request"""
+
+    name = 'Mailgun'
+    max_batch = 1000
+
+    def __init__(self, api_key, domain, base_url='https://api.mailgun.net', pool_size=10):
+        super().__init__(api_key, base_url, pool_size)
+        self.domain = domain
+        self.session.auth = ('api', api_key)
+
+    def _send_batch(self, sender_email, messages):
+        first = messages[0]
+        data = {
+            "from": sender_email,
+            "to": [message.recipient for message in messages],
+            "subject": first.subject,
+            "text": first.text,
+            "html": first.html
+        }
+        if len(messages) > 1:
+            # With recipient-variables Mailgun sends each recipient their own copy
+            data["recipient-variables"] = json.dumps({message.recipient: {} for message in messages})
+        self._post(f'{self.base_url}/v3/{self.domain}/messages', len(messages), data=data)
@@ -1,14 +1,16 @@
 #!/usr/bin/env python3
 """
 Weekly email scheduler for budget reports.
-Sends budget report every Wednesday for the current month.
+Sends every user who turned on email notifications a budget report for the
+current month every Wednesday.
 """
 import schedule
 import time
 import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
-from app import app, db, Expense, BudgetLimit
-from email_service import send_budget_email
+from app import TOMBSTONE_RETENTION_DAYS, app, db, User, monthly_budget_reports, prune_expense_tombstones
+from email_service import close_smtp_pool, provider_stats, send_budget_email
 
 # Load environment variables
 try:
@@ -17,98 +19,107 @@ try:
 except ImportError:
     pass
 
-# Get recipient email from environment variable
-RECIPIENT_EMAIL = os.environ.get('RECIPIENT_EMAIL')
+# Concurrent sends; emails are network-bound, so this can be well above the CPU count
+REPORT_CONCURRENCY = int(os.environ.get('REPORT_CONCURRENCY', '8'))
+# Users loaded and reported on per database round trip
+REPORT_BATCH_SIZE = int(os.environ.get('REPORT_BATCH_SIZE', '500'))
+# Print a progress line every this many sends
+REPORT_PROGRESS_EVERY = 1000
 
 
-def send_weekly_budget_report():
-    """Send weekly budget report for the current month"""
-    if not RECIPIENT_EMAIL:
-        print("❌ RECIPIENT_EMAIL not set in .env file. Skipping email.")
-        return
+def iter_opted_in_users(batch_size=REPORT_BATCH_SIZE):
+    """Yield batches of (user_id, recipient_email) for users with notifications on, by id"""
+    last_id = 0
+    while True:
+        batch = db.session.query(User.id, User.email, User.notification_email).filter(
+            User.email_notifications_enabled.is_(True),
+            User.id > last_id
+        ).order_by(User.id).limit(batch_size).all()
+        if not batch:
+            return
+        yield [(user_id, notification_email or email) for user_id, email, notification_email in batch]
+        last_id = batch[-1][0]
+
+
+def send_report(user_id, recipient_email, budget_data):
+    """Send one report; failures are returned rather than raised so one user can't stop the run"""
+    try:
+        send_budget_email(recipient_email, budget_data)
+        return user_id, None
+    except Exception as e:
+        return user_id, e
+
+
+def send_weekly_budget_report(concurrency=REPORT_CONCURRENCY, batch_size=REPORT_BATCH_SIZE):
+    """
+    Send the current month's budget report to every opted-in user.
+
+    Users are read in id-ordered batches and each batch's reports come from two
+    queries. Reports are handed to a pool of `concurrency` sender threads, with
+    at most two sends per thread in flight so memory stays flat for any user count.
+    Database access stays on this thread; the senders only talk to the email provider.
+    """
+    now = datetime.now()
+    print(f"📧 Sending weekly budget reports for {now.strftime('%B %Y')} ({concurrency} senders)...")
     
-    with app.app_context():
-        try:
-            # Get current month
-            now = datetime.now()
-            current_month = f"{now.year}-{now.month:02d}"
-            
-            print(f"📧 Sending weekly budget report for {now.strftime('%B %Y')} to {RECIPIENT_EMAIL}...")
-            
-            # Get expenses for the current month
-            expenses = Expense.query.filter(
-                Expense.date.like(f'{now.year}-{now.month:02d}%')
-            ).all()
-            
-            # Calculate totals
-            fixed_bills_loans_spent = sum(
-                exp.amount for exp in expenses 
-                if exp.category in ['Bills', 'Loans'] or (exp.category == 'Subscription' and exp.is_bill)
-            )
-            
-            variable_spending_spent = sum(
-                exp.amount for exp in expenses
-                if exp.category not in ['Bills', 'Loans', 'Income', 'Investment', 'Payment'] 
-                and not (exp.category == 'Subscription' and exp.is_bill)
-            )
-            
-            investment_total = sum(exp.amount for exp in expenses if exp.category == 'Investment')
-            income_total = sum(exp.amount for exp in expenses if exp.category == 'Income')
-            
-            # Get budget limits
-            budget_limit = BudgetLimit.query.filter_by(month=current_month).first()
-            if not budget_limit:
-                # Use defaults
-                fixed_bills_loans_limit = 600
-                variable_spending_limit = 800
-                investment_min = 1500
-                investment_max = 1800
+    started = time.perf_counter()
+    sent = 0
+    failed = 0
+    pending = set()
+    
+    def collect(done):
+        nonlocal sent, failed
+        for future in done:
+            user_id, error = future.result()
+            if error is None:
+                sent += 1
             else:
-                fixed_bills_loans_limit = budget_limit.fixed_bills_loans
-                variable_spending_limit = budget_limit.variable_spending
-                investment_min = budget_limit.investing_min
-                investment_max = budget_limit.investing_max
-            
-            # Calculate remaining buffer
-            remaining_buffer = income_total - (fixed_bills_loans_spent + variable_spending_spent + investment_total)
-            
-            # Get top categories
-            category_totals = {}
-            for exp in expenses:
-                if exp.category not in ['Income', 'Investment', 'Payment']:
-                    category_totals[exp.category] = category_totals.get(exp.category, 0) + exp.amount
-            
-            top_categories = [
-                {'category': cat, 'total': total}
-                for cat, total in sorted(category_totals.items(), key=lambda x: x[1], reverse=True)[:5]
-            ]
-            
-            # Format month display
-            month_display = now.strftime('%B %Y')
-            
-            # Prepare budget data
-            budget_data = {
-                'month': month_display,
-                'fixed_bills_loans_spent': fixed_bills_loans_spent,
-                'fixed_bills_loans_limit': fixed_bills_loans_limit,
-                'variable_spending_spent': variable_spending_spent,
-                'variable_spending_limit': variable_spending_limit,
-                'investment_total': investment_total,
-                'investment_min': investment_min,
-                'investment_max': investment_max,
-                'income_total': income_total,
-                'remaining_buffer': remaining_buffer,
-                'top_categories': top_categories
-            }
-            
-            # Send email
-            send_budget_email(RECIPIENT_EMAIL, budget_data)
-            print(f"✅ Weekly budget report sent successfully!")
-            
+                failed += 1
+                print(f"❌ Report for user {user_id} failed: {error}")
+            if (sent + failed) % REPORT_PROGRESS_EVERY == 0:
+                elapsed = time.perf_counter() - started
+                print(f"   {sent + failed:,} processed, {(sent + failed) / elapsed:,.1f} sends/s")
+    
+    with app.app_context(), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        try:
+            for batch in iter_opted_in_users(batch_size):
+                reports = monthly_budget_reports(now.year, now.month, [user_id for user_id, _ in batch])
+                for user_id, recipient_email in batch:
+                    if len(pending) >= concurrency * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    pending.add(pool.submit(send_report, user_id, recipient_email, reports[user_id]))
         except Exception as e:
-            print(f"❌ Error sending weekly budget report: {e}")
+            print(f"❌ Error loading users for weekly budget reports: {e}")
             import traceback
             traceback.print_exc()
+        finally:
+            collect(wait(pending).done)
+            db.session.remove()
+            # Pooled SMTP connections would only time out before next week's run
+            close_smtp_pool()
+    
+    elapsed = time.perf_counter() - started
+    rate = (sent + failed) / elapsed if elapsed else 0
+    print(f"✅ Weekly budget reports: {sent:,} sent, {failed:,} failed in {elapsed:.1f}s ({rate:,.1f} sends/s)")
+    for service, stats in provider_stats().items():
+        if 'p50_ms' in stats:
+            print(f"   {service}: {stats['requests']:,} requests, p50 {stats['p50_ms']:.0f}ms, "
+                  f"p95 {stats['p95_ms']:.0f}ms, rate limited {stats['rate_limited']:,} times")
+    return sent, failed
+
+
+def prune_sync_history():
+    """Drop delta-sync tombstones past their retention, so the table stays bounded"""
+    with app.app_context():
+        try:
+            pruned = prune_expense_tombstones()
+            print(f"🧹 Pruned {pruned:,} expense tombstones older than {TOMBSTONE_RETENTION_DAYS} days")
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error pruning expense tombstones: {e}")
+        finally:
+            db.session.remove()
 
 
 def main():
@@ -117,17 +128,13 @@ def main():
     print("📅 Budget Report Email Scheduler")
     print("=" * 60)
     
-    if not RECIPIENT_EMAIL:
-        print("⚠️  WARNING: RECIPIENT_EMAIL not set in .env file")
-        print("   Add this to your .env file: RECIPIENT_EMAIL=your-email@example.com")
-        print("   The scheduler will run but won't send emails until this is set.")
-        print()
-    
     # Schedule email every Wednesday at 9:00 AM
     schedule.every().wednesday.at("09:00").do(send_weekly_budget_report)
+    schedule.every().day.at("03:00").do(prune_sync_history)
     
     print(f"✅ Scheduled weekly budget reports every Wednesday at 9:00 AM")
-    print(f"📧 Recipient: {RECIPIENT_EMAIL if RECIPIENT_EMAIL else 'NOT SET'}")
+    print(f"📧 Recipients: users with email notifications enabled ({REPORT_CONCURRENCY} concurrent senders)")
+    print(f"🧹 Pruning expense tombstones older than {TOMBSTONE_RETENTION_DAYS} days daily at 3:00 AM")
     print()
     print("🔄 Scheduler running... (Press Ctrl+C to stop)")
     print("=" * 60)
@@ -4,11 +4,15 @@ Supports Gmail SMTP (free) and API-based services like SendGrid, Mailgun.
 """
 import smtplib
 import os
-import requests
+import threading
+import time
+import queue
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 from flask import current_app
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from email_providers import EmailMessage, MailgunClient, SendGridClient
 
 
 def send_budget_email(recipient_email, budget_data):
@@ -33,18 +37,138 @@ def send_budget_email(recipient_email, budget_data):
     # Check if using API-based service (SendGrid, Mailgun) or SMTP
     email_service = os.environ.get('EMAIL_SERVICE', 'smtp').lower()
     
-    # Debug: Print which service is being used (remove in production)
-    print(f"DEBUG: Using email service: {email_service}")
-    
     if email_service in ['sendgrid', 'mailgun']:
         return send_via_api(recipient_email, budget_data, email_service)
     else:
         return send_via_smtp(recipient_email, budget_data)
 
 
-def send_via_smtp(recipient_email, budget_data):
-    """Send email via SMTP (Gmail, etc.)"""
-    # Get email configuration from environment variables
+def send_budget_emails(reports):
+    """
+    Send many budget report emails, batching requests where the service allows it.
+    
+    A generator, so callers can record each result as soon as it is known:
+    SMTP yields after every message, the API providers after the batch.
+    
+    Args:
+        reports: List of (recipient_email, budget_data) tuples
+    
+    Yields:
+        (recipient_email, error) in input order; error is None on success
+    """
+    email_service = os.environ.get('EMAIL_SERVICE', 'smtp').lower()
+    # One footer timestamp for the whole batch
+    generated_at = datetime.now()
+    
+    if email_service in ['sendgrid', 'mailgun']:
+        sender_email, client = get_provider_client(email_service)
+        messages = []
+        for recipient_email, budget_data in reports:
+            html_content, text_content, subject = generate_email_content(budget_data, generated_at)
+            messages.append(EmailMessage(recipient_email, subject, html_content, text_content))
+        yield from client.send_many(sender_email, messages)
+        return
+    
+    for recipient_email, budget_data in reports:
+        try:
+            send_via_smtp(recipient_email, budget_data, generated_at)
+        except Exception as e:
+            yield recipient_email, e
+        else:
+            yield recipient_email, None
+
+
+class SMTPConnectionPool:
+    """
+    Thread-safe pool of logged-in SMTP connections.
+
+    Opening a connection costs a TCP connect, STARTTLS and AUTH, which dominates
+    bulk sends; the pool keeps connections open across messages instead. At
+    most max_size connections exist at once (callers wait for a free one), idle
+    connections older than max_idle seconds are dropped rather than reused,
+    and a send that finds its connection closed by the server reconnects and
+    retries once. Used by send_via_smtp, so the scheduler and the outbox worker
+    share it automatically.
+    """
+
+    def __init__(self, host, port, username=None, password=None, starttls=True,
+                 ssl_context=None, max_size=4, max_idle=60, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.ssl_context = ssl_context
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()  # (connection, last_used); most recently used first
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.connections_opened = 0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                server.starttls(context=self.ssl_context)
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            self._close(server)
+            raise
+        self.connections_opened += 1
+        return server
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _take_idle(self):
+        while True:
+            try:
+                server, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            if time.monotonic() - last_used <= self.max_idle:
+                return server
+            self._close(server)
+
+    def send_message(self, msg):
+        with self._slots:
+            server = self._take_idle() or self._connect()
+            try:
+                try:
+                    server.send_message(msg)
+                except (smtplib.SMTPServerDisconnected, ConnectionError):
+                    # The server dropped an idle connection; one fresh attempt
+                    self._close(server)
+                    server = self._connect()
+                    server.send_message(msg)
+            except Exception:
+                self._close(server)
+                raise
+            self._idle.put((server, time.monotonic()))
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(server)
+
+
+_smtp_pool = None
+_smtp_pool_lock = threading.Lock()
+
+
+def get_smtp_pool():
+    """The process-wide SMTP pool for the configured server, created on first use"""
+    global _smtp_pool
     smtp_server = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
     smtp_port = int(os.environ.get('SMTP_PORT', '587'))
     sender_email = os.environ.get('SENDER_EMAIL')
@@ -53,10 +177,31 @@ def send_via_smtp(recipient_email, budget_data):
     if not sender_email or not sender_password:
         raise ValueError("Email configuration missing. Set SENDER_EMAIL and SENDER_PASSWORD environment variables.")
     
-    # Generate email content
-    html_content, text_content, subject = generate_email_content(budget_data)
+    with _smtp_pool_lock:
+        config = (smtp_server, smtp_port, sender_email, sender_password)
+        if _smtp_pool is None or (_smtp_pool.host, _smtp_pool.port, _smtp_pool.username, _smtp_pool.password) != config:
+            if _smtp_pool is not None:
+                _smtp_pool.close()
+            # One connection per scheduler sender thread unless set, so none of
+            # them waits on the pool; connections only open when a send needs one
+            pool_size = os.environ.get('SMTP_POOL_SIZE') or os.environ.get('REPORT_CONCURRENCY', '8')
+            _smtp_pool = SMTPConnectionPool(
+                smtp_server, smtp_port, sender_email, sender_password, max_size=int(pool_size)
+            )
+        return _smtp_pool
+
+
+def close_smtp_pool():
+    """Close pooled SMTP connections, e.g. at the end of a batch run"""
+    with _smtp_pool_lock:
+        if _smtp_pool is not None:
+            _smtp_pool.close()
+
+
+def build_smtp_message(sender_email, recipient_email, budget_data, generated_at=None):
+    """MIME message with text and HTML versions of the report"""
+    html_content, text_content, subject = generate_email_content(budget_data, generated_at)
     
-    # Create email
     msg = MIMEMultipart('alternative')
     msg['Subject'] = subject
     msg['From'] = sender_email
@@ -65,253 +210,137 @@ def send_via_smtp(recipient_email, budget_data):
     # Attach both versions
     msg.attach(MIMEText(text_content, 'plain'))
     msg.attach(MIMEText(html_content, 'html'))
+    return msg
+
+
+def send_via_smtp(recipient_email, budget_data, generated_at=None):
+    """Send email via SMTP (Gmail, etc.) over a pooled connection"""
+    pool = get_smtp_pool()
+    msg = build_smtp_message(pool.username, recipient_email, budget_data, generated_at)
     
-    # Send email
     try:
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
+        pool.send_message(msg)
         return True
     except Exception as e:
         print(f"Error sending email: {e}")
         raise
 
 
-def send_via_api(recipient_email, budget_data, service):
-    """Send email via API (SendGrid, Mailgun)"""
+_provider_clients = {}
+_provider_clients_lock = threading.Lock()
+
+
+def get_provider_client(service):
+    """
+    The process-wide (sender_email, client) for an API email service, created on first use.
+    
+    Clients keep pooled keep-alive connections, so every send after the first
+    skips the TCP and TLS handshakes.
+    """
     sender_email = os.environ.get('SENDER_EMAIL')
     api_key = os.environ.get('EMAIL_API_KEY')
     
-    # Debug: Print what we found (remove in production)
-    print(f"DEBUG: SENDER_EMAIL={'SET' if sender_email else 'NOT SET'}, EMAIL_API_KEY={'SET' if api_key else 'NOT SET'}")
-    
     if not sender_email or not api_key:
         raise ValueError(f"Email configuration missing. Set SENDER_EMAIL and EMAIL_API_KEY environment variables for {service}.")
     
-    # Generate HTML and text content
-    html_content, text_content, subject = generate_email_content(budget_data)
-    
     if service == 'sendgrid':
-        return send_via_sendgrid(sender_email, recipient_email, subject, html_content, text_content, api_key)
+        config = (service, api_key, os.environ.get('SENDGRID_API_URL', 'https://api.sendgrid.com'))
     elif service == 'mailgun':
-        return send_via_mailgun(sender_email, recipient_email, subject, html_content, text_content, api_key)
+        domain = os.environ.get('MAILGUN_DOMAIN')
+        if not domain:
+            raise ValueError("MAILGUN_DOMAIN environment variable required for Mailgun")
+        config = (service, api_key, os.environ.get('MAILGUN_API_URL', 'https://api.mailgun.net'), domain)
     else:
         raise ValueError(f"Unknown email service: {service}")
+    
+    with _provider_clients_lock:
+        client = _provider_clients.get(config)
+        if client is None:
+            if service == 'sendgrid':
+                client = SendGridClient(api_key, base_url=config[2])
+            else:
+                client = MailgunClient(api_key, domain, base_url=config[2])
+            _provider_clients[config] = client
+    return sender_email, client
 
 
-def send_via_sendgrid(sender_email, recipient_email, subject, html_content, text_content, api_key):
-    """Send email via SendGrid API"""
-    url = "https://api.sendgrid.com/v3/mail/send"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    data = {
-        "personalizations": [{
-            "to": [{"email": recipient_email}]
-        }],
-        "from": {"email": sender_email},
-        "subject": subject,
-        "content": [
-            {"type": "text/plain", "value": text_content},
-            {"type": "text/html", "value": html_content}
-        ]
-    }
-    
-    try:
-        response = requests.post(url, json=data, headers=headers)
-        response.raise_for_status()
-        print(f"✅ Email sent successfully via SendGrid to {recipient_email}")
-        return True
-    except requests.exceptions.HTTPError as e:
-        error_msg = f"SendGrid API error: {e}"
-        if hasattr(e, 'response') and e.response is not None:
-            try:
-                error_detail = e.response.json()
-                error_msg += f" - {error_detail}"
-            except:
-                error_msg += f" - {e.response.text}"
-        print(f"❌ {error_msg}")
-        raise ValueError(error_msg) from e
-    except Exception as e:
-        print(f"❌ Error sending email via SendGrid: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            print(f"Response: {e.response.text}")
-        raise
+def provider_stats():
+    """Send counters and latency percentiles for every API client used in this process"""
+    with _provider_clients_lock:
+        return {config[0]: client.stats.snapshot() for config, client in _provider_clients.items()}
 
 
-def send_via_mailgun(sender_email, recipient_email, subject, html_content, text_content, api_key):
-    """Send email via Mailgun API"""
-    domain = os.environ.get('MAILGUN_DOMAIN')
-    if not domain:
-        raise ValueError("MAILGUN_DOMAIN environment variable required for Mailgun")
-    
-    url = f"https://api.mailgun.net/v3/{domain}/messages"
-    auth = ("api", api_key)
+def send_via_api(recipient_email, budget_data, service):
+    """Send email via API (SendGrid, Mailgun)"""
+    sender_email, client = get_provider_client(service)
     
-    data = {
-        "from": sender_email,
-        "to": recipient_email,
-        "subject": subject,
-        "text": text_content,
-        "html": html_content
-    }
+    # Generate HTML and text content
+    html_content, text_content, subject = generate_email_content(budget_data)
     
-    try:
-        response = requests.post(url, auth=auth, data=data)
-        response.raise_for_status()
-        return True
-    except Exception as e:
-        print(f"Error sending email via Mailgun: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            print(f"Response: {e.response.text}")
-        raise
+    [(_, error)] = client.send_many(sender_email, [EmailMessage(recipient_email, subject, html_content, text_content)])
+    if error is not None:
+        print(f"❌ Error sending email via {client.name}: {error}")
+        raise error
+    return True
 
 
-def generate_email_content(budget_data):
-    """Generate HTML and text email content from budget data"""
-    # Calculate percentages and status
-    bills_percent = (budget_data['fixed_bills_loans_spent'] / budget_data['fixed_bills_loans_limit'] * 100) if budget_data['fixed_bills_loans_limit'] > 0 else 0
-    variable_percent = (budget_data['variable_spending_spent'] / budget_data['variable_spending_limit'] * 100) if budget_data['variable_spending_limit'] > 0 else 0
-    
-    bills_status = "✅" if bills_percent < 100 else "⚠️ EXCEEDED"
-    variable_status = "✅" if variable_percent < 100 else "⚠️ EXCEEDED"
-    
-    investment_status = "✅"
-    if budget_data['investment_total'] < budget_data['investment_min']:
-        investment_status = "📉 Below Target"
-    elif budget_data['investment_total'] > budget_data['investment_max']:
-        investment_status = "📈 Above Max"
-    
-    buffer_status = "✅" if budget_data['remaining_buffer'] >= 0 else "⚠️ NEGATIVE"
-    
-    subject = f'Weekly Budget Report - {budget_data.get("month", "Current Month")}'
-    
-    # Create HTML email
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-            .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 10px 10px 0 0; }}
-            .content {{ background: #f9f9f9; padding: 20px; border-radius: 0 0 10px 10px; }}
-            .budget-item {{ background: white; padding: 15px; margin: 10px 0; border-radius: 8px; border-left: 4px solid #667eea; }}
-            .budget-item.exceeded {{ border-left-color: #ef4444; }}
-            .budget-item.warning {{ border-left-color: #f59e0b; }}
-            .progress-bar {{ background: #e5e7eb; height: 20px; border-radius: 10px; overflow: hidden; margin: 10px 0; }}
-            .progress-fill {{ height: 100%; background: #10b981; transition: width 0.3s; }}
-            .progress-fill.warning {{ background: #f59e0b; }}
-            .progress-fill.exceeded {{ background: #ef4444; }}
-            .amount {{ font-size: 24px; font-weight: bold; color: #667eea; }}
-            .category-list {{ list-style: none; padding: 0; }}
-            .category-list li {{ padding: 8px; background: white; margin: 5px 0; border-radius: 5px; }}
-            .footer {{ text-align: center; margin-top: 20px; color: #6b7280; font-size: 12px; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>💰 Weekly Budget Report</h1>
-                <p>{budget_data.get('month', 'Current Month')}</p>
-            </div>
-            <div class="content">
-                <h2>Budget Summary</h2>
-                
-                <!-- Fixed Bills + Loans -->
-                <div class="budget-item {'exceeded' if bills_percent >= 100 else 'warning' if bills_percent >= 80 else ''}">
-                    <h3>Fixed Bills + Loans {bills_status}</h3>
-                    <div class="amount">${budget_data['fixed_bills_loans_spent']:.2f} / ${budget_data['fixed_bills_loans_limit']:.2f}</div>
-                    <div class="progress-bar">
-                        <div class="progress-fill {'exceeded' if bills_percent >= 100 else 'warning' if bills_percent >= 80 else ''}" 
-                             style="width: {min(100, bills_percent)}%"></div>
-                    </div>
-                    <p>{bills_percent:.1f}% of budget used</p>
-                    <p>Remaining: ${budget_data['fixed_bills_loans_limit'] - budget_data['fixed_bills_loans_spent']:.2f}</p>
-                </div>
-                
-                <!-- Variable Spending -->
-                <div class="budget-item {'exceeded' if variable_percent >= 100 else 'warning' if variable_percent >= 80 else ''}">
-                    <h3>Variable Spending {variable_status}</h3>
-                    <div class="amount">${budget_data['variable_spending_spent']:.2f} / ${budget_data['variable_spending_limit']:.2f}</div>
-                    <div class="progress-bar">
-                        <div class="progress-fill {'exceeded' if variable_percent >= 100 else 'warning' if variable_percent >= 80 else ''}" 
-                             style="width: {min(100, variable_percent)}%"></div>
-                    </div>
-                    <p>{variable_percent:.1f}% of budget used</p>
-                    <p>Remaining: ${budget_data['variable_spending_limit'] - budget_data['variable_spending_spent']:.2f}</p>
-                </div>
-                
-                <!-- Investment -->
-                <div class="budget-item">
-                    <h3>Investment {investment_status}</h3>
-                    <div class="amount">${budget_data['investment_total']:.2f}</div>
-                    <p>Target Range: ${budget_data['investment_min']:.2f} - ${budget_data['investment_max']:.2f}</p>
-                </div>
-                
-                <!-- Remaining Buffer -->
-                <div class="budget-item {'exceeded' if budget_data['remaining_buffer'] < 0 else ''}">
-                    <h3>Remaining Buffer {buffer_status}</h3>
-                    <div class="amount" style="color: {'#ef4444' if budget_data['remaining_buffer'] < 0 else '#10b981'}">
-                        ${budget_data['remaining_buffer']:.2f}
-                    </div>
-                    <p>Income - (Bills/Loans + Variable Spending + Investment)</p>
-                </div>
-                
-                <!-- Top Categories -->
-                {f'''
-                <h3>Top Spending Categories</h3>
-                <ul class="category-list">
-                    {''.join([f'<li><strong>{cat["category"]}:</strong> ${cat["total"]:.2f}</li>' for cat in budget_data.get('top_categories', [])[:5]])}
-                </ul>
-                ''' if budget_data.get('top_categories') else ''}
-                
-                <div class="footer">
-                    <p>Generated on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
-                    <p>This is an automated weekly budget report from your Expense Tracker app.</p>
-                </div>
-            </div>
-        </div>
-    </body>
-    </html>
+EMAIL_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'email')
+GENERATED_AT_FORMAT = '%B %d, %Y at %I:%M %p'
+
+# Built and compiled once per process; each report is then a render of the
+# compiled templates. Autoescaping covers every value the HTML prints.
+email_templates = Environment(
+    loader=FileSystemLoader(EMAIL_TEMPLATE_DIR),
+    autoescape=select_autoescape(['html']),
+    trim_blocks=True,
+    lstrip_blocks=True,
+    auto_reload=False
+)
+budget_report_html = email_templates.get_template('budget_report.html')
+budget_report_text = email_templates.get_template('budget_report.txt')
+
+
+def generate_email_content(budget_data, generated_at=None):
     """
+    Generate HTML and text email content from budget data.
     
-    # Create plain text version
-    text_content = f"""
-    Weekly Budget Report - {budget_data.get('month', 'Current Month')}
-    
-    Fixed Bills + Loans: ${budget_data['fixed_bills_loans_spent']:.2f} / ${budget_data['fixed_bills_loans_limit']:.2f} ({bills_percent:.1f}%)
-    Variable Spending: ${budget_data['variable_spending_spent']:.2f} / ${budget_data['variable_spending_limit']:.2f} ({variable_percent:.1f}%)
-    Investment: ${budget_data['investment_total']:.2f} (Target: ${budget_data['investment_min']:.2f} - ${budget_data['investment_max']:.2f})
-    Remaining Buffer: ${budget_data['remaining_buffer']:.2f}
+    Args:
+        budget_data: Budget dictionary (see send_budget_email)
+        generated_at: Footer timestamp; defaults to now. Batch senders pass one
+            value for the whole batch.
     
-    Generated on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
+    Returns:
+        (html_content, text_content, subject)
     """
-    
-    return html_content, text_content, subject
+    footer = (generated_at or datetime.now()).strftime(GENERATED_AT_FORMAT)
+    subject = f"Weekly Budget Report - {budget_data.get('month', 'Current Month')}"
+    return (
+        budget_report_html.render(**budget_data, generated_at=footer),
+        budget_report_text.render(**budget_data, generated_at=footer),
+        subject
+    )
+
+
+# Sample report sent by send_test_email
+TEST_BUDGET_DATA = {
+    'month': 'Test Month',
+    'fixed_bills_loans_spent': 450.00,
+    'fixed_bills_loans_limit': 600.00,
+    'variable_spending_spent': 650.00,
+    'variable_spending_limit': 800.00,
+    'investment_total': 1500.00,
+    'investment_min': 1500.00,
+    'investment_max': 1800.00,
+    'income_total': 5000.00,
+    'remaining_buffer': 1400.00,
+    'top_categories': [
+        {'category': 'Groceries', 'total': 200.00},
+        {'category': 'Restaurants', 'total': 150.00},
+        {'category': 'Coffee', 'total': 50.00}
+    ]
+}
 
 
 def send_test_email(recipient_email):
     """Send a test email to verify configuration."""
-    test_data = {
-        'month': 'Test Month',
-        'fixed_bills_loans_spent': 450.00,
-        'fixed_bills_loans_limit': 600.00,
-        'variable_spending_spent': 650.00,
-        'variable_spending_limit': 800.00,
-        'investment_total': 1500.00,
-        'investment_min': 1500.00,
-        'investment_max': 1800.00,
-        'income_total': 5000.00,
-        'remaining_buffer': 1400.00,
-        'top_categories': [
-            {'category': 'Groceries', 'total': 200.00},
-            {'category': 'Restaurants', 'total': 150.00},
-            {'category': 'Coffee', 'total': 50.00}
-        ]
-    }
-    return send_budget_email(recipient_email, test_data)
-
+    return send_budget_email(recipient_email, TEST_BUDGET_DATA)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Background delivery worker for the email outbox.
+Claims due EmailOutbox jobs in batches, sends them, and retries failures with
+exponential backoff. Run it as its own process next to the web app and the
+scheduler; several workers can run at once.
+"""
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from app import app, db, EmailOutbox
+from email_providers import REQUEST_TIMEOUT
+from email_service import TEST_BUDGET_DATA, send_budget_emails
+
+# Load environment variables
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+# Jobs claimed per round trip
+EMAIL_WORKER_BATCH_SIZE = int(os.environ.get('EMAIL_WORKER_BATCH_SIZE', '20'))
+# Seconds to sleep when the outbox has nothing due
+EMAIL_WORKER_POLL_INTERVAL = float(os.environ.get('EMAIL_WORKER_POLL_INTERVAL', '5'))
+# Attempts before a job is marked failed
+EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', '6'))
+# First retry delay in seconds; doubles on each attempt, capped at EMAIL_RETRY_MAX_DELAY
+EMAIL_RETRY_BASE_DELAY = 30
+EMAIL_RETRY_MAX_DELAY = 3600
+# A job left in 'sending' this long belongs to a worker that died and is claimed again.
+# Workers renew their claim each time a job finishes, but a provider may take the
+# whole batch in one request, so every job in a batch gets a full request timeout
+EMAIL_LOCK_TIMEOUT = EMAIL_WORKER_BATCH_SIZE * timedelta(seconds=sum(REQUEST_TIMEOUT))
+
+
+def claim_jobs(batch_size=EMAIL_WORKER_BATCH_SIZE):
+    """
+    Claim up to batch_size due jobs for this worker and commit the claim.
+
+    Returns rows of the columns sending needs rather than EmailOutbox objects,
+    which the commit would expire and reload one SELECT at a time.
+    On PostgreSQL the candidate rows are read with FOR UPDATE SKIP LOCKED, so
+    concurrent workers take disjoint batches without waiting on each other.
+    The claiming UPDATE re-checks the status, so on SQLite (which ignores row
+    locks) a job another worker claimed first is simply not returned.
+    """
+    now = datetime.utcnow()
+    due = db.or_(
+        db.and_(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now),
+        db.and_(EmailOutbox.status == 'sending', EmailOutbox.locked_at < now - EMAIL_LOCK_TIMEOUT)
+    )
+    candidate_ids = db.session.scalars(
+        db.select(EmailOutbox.id).where(due)
+        .order_by(EmailOutbox.next_attempt_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not candidate_ids:
+        db.session.rollback()
+        return []
+
+    claimed = db.session.execute(
+        db.update(EmailOutbox)
+        .where(EmailOutbox.id.in_(candidate_ids), due)
+        .values(status='sending', locked_at=now, attempts=EmailOutbox.attempts + 1)
+        .returning(EmailOutbox.id, EmailOutbox.kind, EmailOutbox.recipient, EmailOutbox.payload,
+                   EmailOutbox.attempts)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.session.commit()
+    return claimed
+
+
+def job_budget_data(job):
+    """The report a job sends"""
+    if job.kind == 'budget_report':
+        return json.loads(job.payload)['budget_data']
+    if job.kind == 'test':
+        return TEST_BUDGET_DATA
+    raise ValueError(f"Unknown email kind '{job.kind}'")
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(EMAIL_RETRY_BASE_DELAY * 2 ** (attempts - 1), EMAIL_RETRY_MAX_DELAY))
+
+
+def finish_job(job, error, unsent_ids=()):
+    """Record a claimed job's send result, renew the claim on the batch's unsent jobs, and commit"""
+    now = datetime.utcnow()
+    if error is None:
+        values = {'status': 'sent', 'sent_at': now, 'last_error': None}
+    elif job.attempts >= EMAIL_MAX_ATTEMPTS:
+        values = {'status': 'failed', 'last_error': str(error)[:500]}
+        print(f"❌ Email {job.id} to {job.recipient} failed permanently: {error}")
+    else:
+        values = {'status': 'pending', 'last_error': str(error)[:500],
+                  'next_attempt_at': now + retry_delay(job.attempts)}
+        print(f"⚠️  Email {job.id} to {job.recipient} failed (attempt {job.attempts}), retrying: {error}")
+    db.session.execute(
+        db.update(EmailOutbox).where(EmailOutbox.id == job.id).values(locked_at=None, **values)
+        .execution_options(synchronize_session=False)
+    )
+    if unsent_ids:
+        db.session.execute(
+            db.update(EmailOutbox)
+            .where(EmailOutbox.id.in_(unsent_ids), EmailOutbox.status == 'sending')
+            .values(locked_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+
+
+def process_batch(batch_size=EMAIL_WORKER_BATCH_SIZE):
+    """
+    Claim and send one batch of jobs. Returns the number of jobs claimed.
+
+    The batch goes to the email service in one call, so API providers can
+    combine identical messages (e.g. test emails) into a single request.
+    Each job's result is committed as soon as the service reports it: SMTP
+    after every message, API providers after their one request. The same
+    commit renews locked_at on the jobs still waiting, so another worker only
+    reclaims them once this one has made no progress for EMAIL_LOCK_TIMEOUT.
+    A worker that dies between a send and its commit leaves that job to be
+    claimed and sent again.
+    """
+    jobs = claim_jobs(batch_size)
+    unsent_ids = {job.id for job in jobs}
+    reports = []
+    for job in jobs:
+        try:
+            reports.append((job, job_budget_data(job)))
+        except Exception as e:
+            unsent_ids.discard(job.id)
+            finish_job(job, e, unsent_ids)
+    
+    results = send_budget_emails([(job.recipient, budget_data) for job, budget_data in reports])
+    batch_error = None
+    for job, _ in reports:
+        error = batch_error
+        if error is None:
+            try:
+                _, error = next(results)
+            except Exception as e:
+                # Configuration errors fail the rest of the batch
+                error = batch_error = e
+        unsent_ids.discard(job.id)
+        finish_job(job, error, unsent_ids)
+    return len(jobs)
+
+
+def main():
+    """Main worker loop"""
+    print("=" * 60)
+    print("📬 Email Outbox Worker")
+    print("=" * 60)
+    print(f"🔄 Claiming up to {EMAIL_WORKER_BATCH_SIZE} jobs at a time (Press Ctrl+C to stop)")
+
+    with app.app_context():
+        db.create_all()
+        try:
+            while True:
+                try:
+                    claimed = process_batch()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"❌ Email worker error: {e}")
+                    claimed = 0
+                if not claimed:
+                    time.sleep(EMAIL_WORKER_POLL_INTERVAL)
+        except KeyboardInterrupt:
+            print("\n\n👋 Email worker stopped.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Excel export engine for expense data.
+Streams rows into an openpyxl write-only workbook so memory stays flat no
+matter how many rows are exported, with optional per-month sheets and a
+summary sheet.
+"""
+from itertools import groupby
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment
+from openpyxl.utils import get_column_letter
+
+
+HEADERS = ['Date', 'Category', 'Description', 'Amount', 'Recurring', 'Active', 'Is Bill']
+SUMMARY_HEADERS = ['Month', 'Category', 'Total', 'Count']
+MAX_COLUMN_WIDTH = 50
+
+HEADER_FILL = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+HEADER_FONT = Font(bold=True, color="FFFFFF")
+HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='center')
+
+
+def column_widths(headers, value_lengths):
+    """
+    Column widths for a sheet, matching the old auto-fit rule (longest value + 2, capped at 50).
+
+    Args:
+        headers: Header labels, one per column
+        value_lengths: Longest rendered value per column (None for unknown/empty)
+    """
+    return [
+        min(max(len(header), length or 0) + 2, MAX_COLUMN_WIDTH)
+        for header, length in zip(headers, value_lengths)
+    ]
+
+
+def _create_sheet(wb, title, headers, widths):
+    # Write-only sheets emit their <cols> block on the first append, so
+    # widths have to be in place before any row is written
+    ws = wb.create_sheet(title=title)
+    for col_num, width in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = width
+
+    header_row = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.fill = HEADER_FILL
+        cell.font = HEADER_FONT
+        cell.alignment = HEADER_ALIGNMENT
+        header_row.append(cell)
+    ws.append(header_row)
+    return ws
+
+
+def _expense_row(expense):
+    expense_date, category, description, amount, is_recurring, is_active, is_bill = expense
+    return [
+        expense_date.strftime('%Y-%m-%d'),
+        category,
+        description,
+        amount,
+        'Yes' if is_recurring else 'No',
+        'Yes' if is_active else 'No',
+        'Yes' if is_bill else 'No'
+    ]
+
+
+def write_expense_workbook(output, rows, value_lengths, summary_rows=None, sheet_per_month=False):
+    """
+    Write expenses to an .xlsx file in a single streaming pass.
+
+    Args:
+        output: Binary file-like object to save the workbook into
+        rows: Iterable of (date, category, description, amount, is_recurring, is_active, is_bill)
+            tuples, ordered by date so months arrive contiguously
+        value_lengths: Longest value per column, keyed by 'YYYY-MM' when sheet_per_month
+            is set, or by None for the single Expenses sheet
+        summary_rows: Optional iterable of (month, category, total, count) tuples for a
+            Summary sheet placed first
+        sheet_per_month: Write one sheet per month instead of a single Expenses sheet
+
+    Returns:
+        Number of expense rows written
+    """
+    wb = Workbook(write_only=True)
+
+    if summary_rows is not None:
+        summary_rows = list(summary_rows)
+        summary_lengths = [
+            max((len(str(row[i])) for row in summary_rows), default=0)
+            for i in range(len(SUMMARY_HEADERS))
+        ]
+        ws = _create_sheet(wb, 'Summary', SUMMARY_HEADERS, column_widths(SUMMARY_HEADERS, summary_lengths))
+        for row in summary_rows:
+            ws.append(list(row))
+
+    row_count = 0
+    if sheet_per_month:
+        for month, month_rows in groupby(rows, key=lambda row: row[0].strftime('%Y-%m')):
+            widths = column_widths(HEADERS, value_lengths.get(month, [None] * len(HEADERS)))
+            ws = _create_sheet(wb, month, HEADERS, widths)
+            for expense in month_rows:
+                ws.append(_expense_row(expense))
+                row_count += 1
+    else:
+        widths = column_widths(HEADERS, value_lengths.get(None, [None] * len(HEADERS)))
+        ws = _create_sheet(wb, 'Expenses', HEADERS, widths)
+        for expense in rows:
+            ws.append(_expense_row(expense))
+            row_count += 1
+
+    if not wb.worksheets:
+        _create_sheet(wb, 'Expenses', HEADERS, column_widths(HEADERS, [None] * len(HEADERS)))
+
+    wb.save(output)
+    return row_count
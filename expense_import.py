@@ -0,0 +1,158 @@
+"""
+Parsing and validation for bulk expense imports.
+Reads the same layout the CSV/Excel exports produce and validates rows in a
+single streaming pass, so uploads of any size never sit in memory as a whole.
+"""
+import csv
+import io
+import math
+from datetime import date, datetime
+from openpyxl import load_workbook
+
+
+REQUIRED_COLUMNS = ['date', 'category', 'description', 'amount']
+OPTIONAL_COLUMNS = ['subcategory', 'recurring', 'active', 'is bill']
+TRUE_VALUES = {'yes', 'y', 'true', '1'}
+FALSE_VALUES = {'no', 'n', 'false', '0'}
+
+
+class ImportFormatError(ValueError):
+    """The uploaded file can't be read as an expense import at all"""
+
+
+def _column_map(header):
+    """Map normalised header names (e.g. 'is bill') to their column positions"""
+    columns = {}
+    for index, name in enumerate(header):
+        key = str(name).strip().lower() if name is not None else ''
+        if key in REQUIRED_COLUMNS or key in OPTIONAL_COLUMNS:
+            columns.setdefault(key, index)
+    return columns
+
+
+def iter_csv_rows(stream):
+    """Yield (row_number, columns, values) from a CSV upload; the header is row 1"""
+    reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    header = next(reader, None)
+    if header is None:
+        raise ImportFormatError('File is empty')
+    columns = _column_map(header)
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    if missing:
+        raise ImportFormatError(f"Missing required columns: {', '.join(missing)}")
+    for row_number, row in enumerate(reader, 2):
+        if any(cell.strip() for cell in row):
+            yield row_number, columns, row
+
+
+def iter_xlsx_rows(stream):
+    """
+    Yield (row_label, columns, values) from every sheet of an .xlsx upload that has the
+    expense header, so per-month exports re-import as-is and Summary sheets are skipped.
+    """
+    try:
+        wb = load_workbook(stream, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFormatError(f'Could not read Excel file: {e}') from e
+
+    found_sheet = False
+    try:
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                continue
+            columns = _column_map(header)
+            if any(name not in columns for name in REQUIRED_COLUMNS):
+                continue
+            found_sheet = True
+            for row_number, row in enumerate(rows, 2):
+                if any(cell not in (None, '') for cell in row):
+                    yield f'{ws.title}!{row_number}', columns, row
+    finally:
+        wb.close()
+
+    if not found_sheet:
+        raise ImportFormatError(f"No sheet has the required columns: {', '.join(REQUIRED_COLUMNS)}")
+
+
+def _cell(row, columns, name):
+    index = columns.get(name)
+    if index is None or index >= len(row):
+        return None
+    return row[index]
+
+
+def _text(value):
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def _flag(value, default):
+    text = _text(value).lower()
+    if not text:
+        return default
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"expected Yes/No, got '{value}'")
+
+
+def parse_row(columns, row):
+    """
+    Validate one row and return the Expense column values.
+
+    Raises:
+        ValueError: with a user-facing message when the row is invalid
+    """
+    raw_date = _cell(row, columns, 'date')
+    if isinstance(raw_date, datetime):
+        expense_date = raw_date.date()
+    elif isinstance(raw_date, date):
+        expense_date = raw_date
+    else:
+        try:
+            expense_date = date.fromisoformat(_text(raw_date)[:10])
+        except ValueError:
+            raise ValueError(f"invalid date '{_text(raw_date)}', expected YYYY-MM-DD")
+
+    category = _text(_cell(row, columns, 'category'))
+    if not category:
+        raise ValueError('category is required')
+    if len(category) > 100:
+        raise ValueError('category is longer than 100 characters')
+
+    description = _text(_cell(row, columns, 'description'))
+    if not description:
+        raise ValueError('description is required')
+    if len(description) > 500:
+        raise ValueError('description is longer than 500 characters')
+
+    raw_amount = _cell(row, columns, 'amount')
+    try:
+        amount = float(raw_amount if isinstance(raw_amount, (int, float)) else _text(raw_amount).replace(',', '').lstrip('$'))
+    except ValueError:
+        raise ValueError(f"invalid amount '{_text(raw_amount)}'")
+    if not math.isfinite(amount):
+        raise ValueError(f"invalid amount '{_text(raw_amount)}'")
+
+    subcategory = _text(_cell(row, columns, 'subcategory')) or None
+    if subcategory and len(subcategory) > 100:
+        raise ValueError('subcategory is longer than 100 characters')
+    is_recurring = _flag(_cell(row, columns, 'recurring'), False)
+    is_active = _flag(_cell(row, columns, 'active'), True)
+    # Same rule as add_expense: is_bill only applies to subscriptions
+    is_bill = _flag(_cell(row, columns, 'is bill'), False) and category == 'Subscription'
+
+    return {
+        'date': expense_date,
+        'category': category,
+        'subcategory': subcategory,
+        'description': description,
+        'amount': amount,
+        'is_recurring': is_recurring,
+        'is_active': is_active,
+        'is_bill': is_bill
+    }
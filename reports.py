@@ -0,0 +1,118 @@
+"""
+Budget report computation shared by the email API and the weekly scheduler.
+Totals come from one conditional-aggregation GROUP BY query (or one Python
+pass over raw rows), so a report costs the same no matter how it is sent.
+"""
+import heapq
+from sqlalchemy import and_, case, func, not_, or_, select
+
+
+FIXED_CATEGORIES = ('Bills', 'Loans')
+NON_SPENDING_CATEGORIES = ('Income', 'Investment', 'Payment')
+TOP_CATEGORY_COUNT = 5
+
+
+def is_fixed(category, is_bill):
+    """Bills, Loans and subscriptions paid as bills count against the fixed budget"""
+    return category in FIXED_CATEGORIES or (category == 'Subscription' and bool(is_bill))
+
+
+def category_totals_statement(category, is_bill, amount):
+    """
+    SELECT of per-category fixed, variable, investment and income totals.
+
+    Works over any table with category/is_bill/amount-like columns, e.g. Expense
+    (amount) or MonthlyRollup (total). Add WHERE clauses to pick the month and user.
+
+    Args:
+        category: Category column
+        is_bill: Boolean is_bill column
+        amount: Amount column to sum
+
+    Returns:
+        Select yielding (category, fixed, variable, investment, income) rows
+    """
+    fixed = or_(category.in_(FIXED_CATEGORIES), and_(category == 'Subscription', is_bill.is_(True)))
+    variable = and_(
+        category.notin_(FIXED_CATEGORIES + NON_SPENDING_CATEGORIES),
+        not_(and_(category == 'Subscription', is_bill.is_(True)))
+    )
+    return select(
+        category,
+        func.sum(case((fixed, amount), else_=0)),
+        func.sum(case((variable, amount), else_=0)),
+        func.sum(case((category == 'Investment', amount), else_=0)),
+        func.sum(case((category == 'Income', amount), else_=0))
+    ).group_by(category)
+
+
+def category_totals_from_rows(rows):
+    """
+    Python equivalent of category_totals_statement() in one pass over raw rows.
+
+    Args:
+        rows: Iterable of (category, is_bill, amount) tuples
+
+    Returns:
+        List of (category, fixed, variable, investment, income) tuples
+    """
+    totals = {}
+    for category, is_bill, amount in rows:
+        bucket = totals.get(category)
+        if bucket is None:
+            bucket = totals[category] = [0.0, 0.0, 0.0, 0.0]
+        if is_fixed(category, is_bill):
+            bucket[0] += amount
+        elif category not in NON_SPENDING_CATEGORIES:
+            bucket[1] += amount
+        elif category == 'Investment':
+            bucket[2] += amount
+        elif category == 'Income':
+            bucket[3] += amount
+    return [(category, *bucket) for category, bucket in totals.items()]
+
+
+def build_budget_data(month_display, category_rows, limits):
+    """
+    Build the budget_data dict the report emails are rendered from.
+
+    Args:
+        month_display: Month label shown in the email, e.g. 'March 2025'
+        category_rows: (category, fixed, variable, investment, income) rows from
+            category_totals_statement() or category_totals_from_rows()
+        limits: Budget limits dict with fixed_bills_loans, variable_spending,
+            investing_min and investing_max
+
+    Returns:
+        Dict with spent/limit totals, income, remaining buffer and top categories
+    """
+    fixed_total = variable_total = investment_total = income_total = 0.0
+    spending = []
+    for category, fixed, variable, investment, income in category_rows:
+        fixed, variable = float(fixed or 0), float(variable or 0)
+        fixed_total += fixed
+        variable_total += variable
+        investment_total += float(investment or 0)
+        income_total += float(income or 0)
+        # Fixed + variable is exactly the category's spending outside Income/Investment/Payment
+        if category not in NON_SPENDING_CATEGORIES:
+            spending.append((fixed + variable, category))
+
+    top_categories = [
+        {'category': category, 'total': total}
+        for total, category in heapq.nlargest(TOP_CATEGORY_COUNT, spending)
+    ]
+
+    return {
+        'month': month_display,
+        'fixed_bills_loans_spent': fixed_total,
+        'fixed_bills_loans_limit': limits['fixed_bills_loans'],
+        'variable_spending_spent': variable_total,
+        'variable_spending_limit': limits['variable_spending'],
+        'investment_total': investment_total,
+        'investment_min': limits['investing_min'],
+        'investment_max': limits['investing_max'],
+        'income_total': income_total,
+        'remaining_buffer': income_total - (fixed_total + variable_total + investment_total),
+        'top_categories': top_categories
+    }